@@ -1,68 +1,31 @@
-import networkx as nx
 import numpy as np
-import itertools
+import math
+from collections import Counter
+import nD_equilibria_finder as nD
+from symmetric_payoffs import SymmetricPayoffs
 
 
-def payoff_finder_one_dim(num_positions, num_players):
+def payoff_finder_one_dim(num_positions, num_players, metric="l1", cache=None):
     """
     Find an individual payoff tensor for each player on the num_positions
-    election grid.
+    election grid. The cache is used as in nD_equilibria_finder.payoff_finder.
     """
-    # creating a graph that represents the positions and distance between them
-    G = nx.grid_graph([num_positions])
-    distance_dict = dict(nx.all_pairs_shortest_path_length(G))
-    position_list = [i for i in range(num_positions)]
-    # obtaining all permutations for the player positions
-    position_permutations = np.array([list(product) for product in itertools.product(position_list, repeat=num_players)])
-
-    # creating an individual tensor per player
-    player_tensor = np.zeros((num_positions,) * num_players)
-    outcome_list = [player_tensor.copy() for i in range(num_players)]
-
-    for player_positions in position_permutations:
-        outcome = np.array([0 for i in range(num_players)], dtype="float")
-        for spot in position_list:
-            closest_players = {}
-            closest_distance = num_positions + 1
-            for i in range(num_players):
-                if distance_dict[spot][player_positions[i]] < closest_distance:
-                    closest_players = {}
-                    closest_players[player_positions[i]] = [i]
-                    closest_distance = distance_dict[spot][player_positions[i]]
-                elif distance_dict[spot][player_positions[i]] == closest_distance:
-                    if player_positions[i] in closest_players.keys():
-                        closest_players[player_positions[i]].append(i)
-                    else:
-                        closest_players[player_positions[i]] = [i]
-            for key in closest_players.keys():
-                # spltting the outcome so that if we have 2 left and 1 right, the left gets 2.5% each and the right 5%
-                outcome[closest_players[key]] += 1/(len(closest_players.keys()) * len(closest_players[key]) * num_positions)
-        for j in range(num_players):
-            outcome_list[j][tuple(player_positions)] += outcome[j]
-    return outcome_list
+    # payoff_finder gives the payoff of the last player, so each player's tensor
+    # is a view of it with that player's axis moved into place
+    payoff_tensor = nD.payoff_finder(num_positions, 1, num_players, metric, cache)
+    return [np.moveaxis(payoff_tensor, -1, player) for player in range(num_players)]
 
 
 def get_best_response_for_players(num_positions, num_players):
     """
     Find the best response for a player, for each permutation of all other
-    players' positions
+    players' positions, as a boolean mask over all profiles per player
     """
-    outcome_list = payoff_finder_one_dim(num_positions, num_players)
-    response_list = [[] for i in range(num_players)]
-    position_list = [i for i in range(num_positions)]
-    # get all the permutations of other players
-    position_permutations = np.array([list(product) for product in itertools.product(position_list, repeat=num_players-1)])
-    for player in range(num_players):
-        for position in position_permutations:
-            # slice(None) takes the entire column
-            new_list = list(position)[0:player] + [slice(None)] + list(position)[player:]
-            possible_outcomes = outcome_list[player][tuple(new_list)]
-            # gets all best responses possible, had to use isclose due to floating point errors
-            best_response = np.argwhere(np.isclose(possible_outcomes, np.max(possible_outcomes), 1e-6))
-            for val in best_response:
-                new_list = list(position)[0:player] + [val[0]] + list(position)[player:]
-                response_list[player].append(new_list)
-    return response_list
+    payoff_tensor = nD.payoff_finder(num_positions, 1, num_players)
+    # had to use isclose due to floating point errors
+    best_responses = nD.BestResponseIndex(payoff_tensor, num_positions, 1, rtol=1e-6).is_best_response
+    # the mask is for the last player, moving its axis gives the mask of each player
+    return [np.moveaxis(best_responses, -1, player) for player in range(num_players)]
 
 
 def get_equilibria_for_players(num_positions, num_players):
@@ -72,35 +35,42 @@ def get_equilibria_for_players(num_positions, num_players):
     """
     # this checks if the best responses intersect
     response_list = get_best_response_for_players(num_positions, num_players)
-    equilibrium_list = []
-    for response in response_list[0]:
-        add_to_list = True
-        for i in range(1, len(response_list)):
-            if response not in response_list[i]:
-                add_to_list = False
-                break
-        if add_to_list:
-            equilibrium_list.append(response)
+    equilibrium_mask = response_list[0].copy()
+    for response in response_list[1:]:
+        equilibrium_mask &= response
+    # listed with the first player's position varying fastest
+    equilibrium_list = np.roll(np.argwhere(np.moveaxis(equilibrium_mask, 0, -1)), 1, axis=1)
     equilibrium_count = len(equilibrium_list)
-    return [equilibrium for equilibrium in equilibrium_list], equilibrium_count
+    return [[int(x) for x in equilibrium] for equilibrium in equilibrium_list], equilibrium_count
+
+
+def get_unique_equilibria_for_players(num_positions, num_players):
+    """
+    Obtain the equilibria for the game with permutations discarded, only visiting
+    sorted profiles, so larger games than get_equilibria_for_players can handle.
+    """
+    return SymmetricPayoffs(num_positions, 1, num_players).equilibria(rtol=1e-6)
+
+
+def count_equilibria(unique_equilibria):
+    """
+    Number of equilibria counting every order of the players, as get_equilibria_for_players does,
+    from the sorted equilibria of get_unique_equilibria_for_players.
+    """
+    return sum(math.factorial(len(equilibrium)) // math.prod(math.factorial(c) for c in Counter(equilibrium).values())
+               for equilibrium in unique_equilibria)
 
 
-# obtaining values for the table seen in the report
-player_list = [2, 3, 4, 5]
-num_spaces = [10, 11]
-for player in player_list:
-    for spaces in num_spaces:
-        print(f"Equilibria for {player} players and {spaces} spaces")
-        eq, eq_count = get_equilibria_for_players(spaces, player)
-        print(eq)
-        print(eq_count)
-        eq_set = []
-        # obtains the unique equilibria (permutations discarded)
-        for equilibrium in eq:
-            x = np.sort(equilibrium)
-            if list(x) in eq_set:
-                pass
-            else:
-                eq_set.append(list(x))
-        print(eq_set)
-        np.save(f"{player}-{spaces}", eq)
+if __name__ == "__main__":
+    # obtaining values for the table seen in the report, only visiting sorted profiles
+    # so that the larger games fit in memory
+    player_list = [2, 3, 4, 5, 6, 7, 8]
+    num_spaces = [10, 11, 20, 21]
+    for player in player_list:
+        for spaces in num_spaces:
+            print(f"Equilibria for {player} players and {spaces} spaces")
+            # the unique equilibria (permutations discarded), in increasing order
+            eq_set = [list(x) for x in get_unique_equilibria_for_players(spaces, player)]
+            print(eq_set)
+            print(count_equilibria(eq_set))
+            np.save(f"{player}-{spaces}-unique", eq_set)
@@ -1,5 +1,31 @@
 import numpy as np
+import time
 #attempt at a mixed equilibrium finder
+
+
+class SolverResult:
+    """
+    Outcome of a MixedEquilibriumFinder solver.
+    """
+
+    def __init__(self, method, strategy, iterations, wall_time, gap):
+        """
+        :param method: name of the solver in SOLVERS
+        :param strategy: [strategy_0, strategy_1]
+        :param iterations: number of iterations (pivots for lemke_howson) taken
+        :param wall_time: wall time in seconds
+        :param gap: epsilon-Nash gap of the strategy, see MixedEquilibriumFinder.nash_gap
+        """
+        self.method = method
+        self.strategy = strategy
+        self.iterations = iterations
+        self.wall_time = wall_time
+        self.gap = gap
+
+    def __repr__(self):
+        return f"SolverResult({self.method}: {self.iterations} iterations, {self.wall_time:.3g}s, gap {self.gap:.3g})"
+
+
 class MixedEquilibriumFinder:
     """
     Finds mixed equilibrium for a two player finite dimensional game.
@@ -8,13 +34,18 @@ class MixedEquilibriumFinder:
     def __init__(self,payoff,starting_strategy_0, starting_strategy_1):
         """
 
-        :param payoff: numpy array of size R^(pure strategies 0)*(pure strategies 1)*2
+        :param payoff: numpy array of size R^2*(pure strategies 0)*(pure strategies 1)
         :param starting_strategy_0: numpy array of size R^(pure strategies 0)
         :param starting_strategy_1: numpy array of size R^(pure strategies 1)
         """
-        self.payoff = payoff
-        self.strategy = np.array([starting_strategy_0,starting_strategy_1])
+        self.payoff = np.asarray(payoff, dtype=float)
+        self.strategy = [np.array(starting_strategy_0, dtype=float), np.array(starting_strategy_1, dtype=float)]
         self.game_size = np.array([len(starting_strategy_0), len(starting_strategy_1)])
+        # buffers reused by every update, so iterating allocates nothing
+        self.pure_payoffs = [np.empty(n) for n in self.game_size]
+        self.previous_strategy = [np.empty(n) for n in self.game_size]
+        # number of iterations taken by the last call to find_equilibrium
+        self.iterations = 0
 
     def expected_payoff(self,player,strategy):
         """
@@ -29,52 +60,320 @@ class MixedEquilibriumFinder:
         updates strategy iteratively via the rule outlined by Nash
         :return: numpy array (strategy 0, strategy 1)
         """
-        def basis_vector(i,n):
-            e = np.zeros(n)
-            e[i] = 1
-            return e
-
-        payoff_matrix_0 = np.array(
-            [self.expected_payoff(0,[basis_vector(i,self.game_size[0]),self.strategy[1]]) for i in range(self.game_size[0])])
-        payoff_matrix_1 = np.array(
-            [self.expected_payoff(1, [self.strategy[0],basis_vector(i, self.game_size[1])]) for i in range(self.game_size[1])])
-        x_0 = np.maximum(0, payoff_matrix_0 - self.expected_payoff(0, self.strategy)*np.ones(self.game_size[0]))
-        p_0 = np.add(self.strategy[0], x_0) / (1+np.sum(x_0))
-        x_1 = np.maximum(0, payoff_matrix_1 - self.expected_payoff(1, self.strategy)*np.ones(self.game_size[1]))
-        p_1 = np.add(self.strategy[1], x_1) / (1 + np.sum(x_1))
-        self.strategy[0] = p_0
-        self.strategy[1] = p_1
+        p_0, p_1 = self.strategy
+        x_0, x_1 = self.pure_payoffs
+        # payoff of every pure strategy against the other player's current strategy
+        np.matmul(self.payoff[0], p_1, out=x_0)
+        np.matmul(p_0, self.payoff[1], out=x_1)
+        value_0 = p_0 @ x_0
+        value_1 = x_1 @ p_1
+        # gains over the current expected payoff, both computed before either strategy changes
+        x_0 -= value_0
+        np.maximum(x_0, 0, out=x_0)
+        x_1 -= value_1
+        np.maximum(x_1, 0, out=x_1)
+        p_0 += x_0
+        p_0 /= 1 + np.sum(x_0)
+        p_1 += x_1
+        p_1 /= 1 + np.sum(x_1)
+        return self.strategy
 
-    def find_equilibrium(self, thresh, max_iterations):
+    def find_equilibrium(self, thresh, max_iterations, print_every=None, metrics=None):
         """
         Attempts to find equilibrium stopping when difference between two consecutive updates is below the threshold or
         when the maximum number of iterations is reached. The 'difference' is just the 1-norm of the strategy.
-        :param error: float
-        :param iterations: integer
-        :return: numpy array [strategy_0, strategy_1]
+        :param thresh: float
+        :param max_iterations: integer
+        :param print_every: if given, the strategy is printed every print_every iterations
+        :param metrics: instrumentation.RunMetrics receiving the iterations done as "iterations" progress,
+        the ETA assumes all max_iterations are run
+        :return: [strategy_0, strategy_1]
         """
-        # TODO iterate the update strategy method to find equilibrium
         iterations = 0
         error = 10000
+        if metrics:
+            metrics.progress("iterations", 0, max_iterations)
         while iterations<max_iterations and thresh<error:
-            starting_strategy = self.strategy.copy()
+            error = 0
+            for previous, strategy in zip(self.previous_strategy, self.strategy):
+                np.copyto(previous, strategy)
             self.update_strategy()
-            end_strategy = self.strategy
-            error = np.sum(np.abs(np.subtract(end_strategy,starting_strategy)))
+            for previous, strategy in zip(self.previous_strategy, self.strategy):
+                previous -= strategy
+                error += np.sum(np.abs(previous, out=previous))
             iterations += 1
-            if iterations %1000 ==0:
+            if print_every and iterations % print_every == 0:
                 print(self.strategy)
+            if metrics:
+                metrics.progress("iterations", iterations, max_iterations)
 
+        if metrics and iterations < max_iterations:  # reports the end of a run that converged early
+            metrics.progress("iterations", iterations, iterations)
+        self.iterations = iterations
         return self.strategy
 
+    def find_equilibria(self, starting_strategies_0, starting_strategies_1, thresh, max_iterations):
+        """
+        Runs the same iteration as find_equilibrium from many starting strategies at once, e.g. to map
+        basins of attraction. A row stops updating once its difference is below the threshold.
+        :param starting_strategies_0: numpy array of size R^batch*(pure strategies 0)
+        :param starting_strategies_1: numpy array of size R^batch*(pure strategies 1)
+        :param thresh: float
+        :param max_iterations: integer
+        :return: final strategies of each player as (batch, pure strategies) arrays,
+        and the number of iterations each row took
+        """
+        p_0 = np.array(starting_strategies_0, dtype=float)
+        p_1 = np.array(starting_strategies_1, dtype=float)
+        batch = len(p_0)
+        x_0, x_1 = np.empty(p_0.shape), np.empty(p_1.shape)
+        previous_0, previous_1 = np.empty(p_0.shape), np.empty(p_1.shape)
+        value_0, value_1, error, error_1 = np.empty(batch), np.empty(batch), np.empty(batch), np.empty(batch)
+        active = np.ones(batch, dtype=bool)
+        iterations = np.zeros(batch, dtype=int)
+        payoff_0_transposed = self.payoff[0].T
+
+        for _ in range(max_iterations):
+            np.copyto(previous_0, p_0)
+            np.copyto(previous_1, p_1)
+            np.matmul(p_1, payoff_0_transposed, out=x_0)
+            np.matmul(p_0, self.payoff[1], out=x_1)
+            np.einsum("bi,bi->b", p_0, x_0, out=value_0)
+            np.einsum("bj,bj->b", x_1, p_1, out=value_1)
+            x_0 -= value_0[:, None]
+            np.maximum(x_0, 0, out=x_0)
+            x_1 -= value_1[:, None]
+            np.maximum(x_1, 0, out=x_1)
+            # converged rows get no gains, which leaves their strategies unchanged
+            x_0 *= active[:, None]
+            x_1 *= active[:, None]
+            p_0 += x_0
+            p_0 /= 1 + np.sum(x_0, axis=1, keepdims=True)
+            p_1 += x_1
+            p_1 /= 1 + np.sum(x_1, axis=1, keepdims=True)
+
+            iterations += active
+            previous_0 -= p_0
+            previous_1 -= p_1
+            np.sum(np.abs(previous_0, out=previous_0), axis=1, out=error)
+            error += np.sum(np.abs(previous_1, out=previous_1), axis=1, out=error_1)
+            active &= thresh < error
+            if not active.any():
+                break
+
+        return p_0, p_1, iterations
+
+    def nash_gap(self, strategy=None):
+        """
+        largest amount either player could gain by deviating to a pure strategy, 0 at an equilibrium
+        :param strategy: [strategy_0, strategy_1], defaults to the current strategy
+        :return: float
+        """
+        p_0, p_1 = self.strategy if strategy is None else strategy
+        x_0 = self.payoff[0] @ p_1
+        x_1 = p_0 @ self.payoff[1]
+        return max(np.max(x_0) - p_0 @ x_0, np.max(x_1) - x_1 @ p_1)
+
+    def solve(self, method="nash", **kwargs):
+        """
+        finds an equilibrium with one of the solvers in SOLVERS, which becomes the current strategy
+        :param method: name of the solver
+        :param kwargs: passed to the solver
+        :return: SolverResult
+        """
+        if method not in SOLVERS:
+            raise ValueError(f"Unknown solver {method}, expected one of {list(SOLVERS)}.")
+        start = time.perf_counter()
+        strategy, iterations = SOLVERS[method](self, **kwargs)
+        elapsed = time.perf_counter() - start
+        self.strategy = [np.asarray(s, dtype=float) for s in strategy]
+        return SolverResult(method, self.strategy, iterations, elapsed, self.nash_gap())
+
+    def nash_map(self, thresh=1e-8, max_iterations=100000):
+        """
+        the iteration of find_equilibrium, from the current strategy
+        :return: [strategy_0, strategy_1], number of iterations
+        """
+        strategy = self.find_equilibrium(thresh, max_iterations)
+        return strategy, self.iterations
+
+    def fictitious_play(self, thresh=1e-3, max_iterations=100000, check_every=100):
+        """
+        each player best responds to the empirical mix of the other's past plays, starting from
+        best responses to the current strategy; the empirical mixes converge for zero/constant-sum games
+        :param thresh: stop once the nash gap of the empirical mixes is below this
+        :param max_iterations: integer
+        :param check_every: number of iterations between computing the nash gap
+        :return: [strategy_0, strategy_1], number of iterations
+        """
+        payoff_0_columns = np.ascontiguousarray(self.payoff[0].T)
+        payoff_1 = self.payoff[1]
+        counts_0, counts_1 = np.zeros(self.game_size[0]), np.zeros(self.game_size[1])
+        # total payoff of each pure strategy against all past plays of the other player
+        total_0, total_1 = np.zeros(self.game_size[0]), np.zeros(self.game_size[1])
+        i = np.argmax(self.payoff[0] @ self.strategy[1])
+        j = np.argmax(self.strategy[0] @ payoff_1)
+        strategy = self.strategy
+        iterations = 0
+        for iterations in range(1, max_iterations + 1):
+            counts_0[i] += 1
+            counts_1[j] += 1
+            total_0 += payoff_0_columns[j]
+            total_1 += payoff_1[i]
+            i = np.argmax(total_0)
+            j = np.argmax(total_1)
+            if iterations % check_every == 0 or iterations == max_iterations:
+                strategy = [counts_0 / iterations, counts_1 / iterations]
+                if self.nash_gap(strategy) < thresh:
+                    break
+        return strategy, iterations
+
+    def replicator_dynamics(self, step=0.1, thresh=1e-8, max_iterations=100000):
+        """
+        Euler steps of the replicator equation, strategies doing better than average grow in proportion;
+        pure strategies absent from the starting strategy are never played
+        :param step: step size, relative to the range of payoffs
+        :param thresh: stop when the 1-norm of the change in strategy is below this
+        :param max_iterations: integer
+        :return: [strategy_0, strategy_1], number of iterations
+        """
+        p_0, p_1 = (s.copy() for s in self.strategy)
+        scale = step / max(np.ptp(self.payoff), 1e-12)
+        iterations = 0
+        for iterations in range(1, max_iterations + 1):
+            x_0 = self.payoff[0] @ p_1
+            x_1 = p_0 @ self.payoff[1]
+            change_0 = scale * p_0 * (x_0 - p_0 @ x_0)
+            change_1 = scale * p_1 * (x_1 - x_1 @ p_1)
+            p_0 = np.maximum(p_0 + change_0, 0)
+            p_0 /= np.sum(p_0)
+            p_1 = np.maximum(p_1 + change_1, 0)
+            p_1 /= np.sum(p_1)
+            if np.sum(np.abs(change_0)) + np.sum(np.abs(change_1)) < thresh:
+                break
+        return [p_0, p_1], iterations
+
+    def lemke_howson(self, initial_dropped_label=0, max_iterations=100000):
+        """
+        Lemke-Howson complementary pivoting, with lexicographic ratio tests so degenerate games
+        such as the election game terminate
+        :param initial_dropped_label: label 0..m-1 (strategy of player 0) or m..m+n-1 (of player 1) to drop first
+        :param max_iterations: largest number of pivots
+        :return: [strategy_0, strategy_1], number of pivots
+        """
+        m, n = self.game_size
+        # payoffs shifted to be positive, which leaves the equilibria unchanged
+        payoff_0 = self.payoff[0] - np.min(self.payoff[0]) + 1
+        payoff_1 = self.payoff[1] - np.min(self.payoff[1]) + 1
+        # columns of both tableaux are indexed by label, the final column is the right hand side
+        # tableau 0 holds payoff_1^T x + s = 1, labels of x are 0..m-1 and of s are m..m+n-1
+        tableau_0 = np.hstack([payoff_1.T, np.eye(n), np.ones((n, 1))])
+        basis_0 = list(range(m, m + n))
+        # tableau 1 holds r + payoff_0 y = 1, labels of r are 0..m-1 and of y are m..m+n-1
+        tableau_1 = np.hstack([np.eye(m), payoff_0, np.ones((m, 1))])
+        basis_1 = list(range(m))
+        tableaux = [(tableau_0, basis_0), (tableau_1, basis_1)]
+
+        current = 0 if initial_dropped_label < m else 1
+        entering = initial_dropped_label
+        iterations = 0
+        while iterations < max_iterations:
+            tableau, basis = tableaux[current]
+            leaving = pivot(tableau, basis, entering, initial_basis=range(m, m + n) if current == 0 else range(m))
+            iterations += 1
+            if leaving == initial_dropped_label:
+                break
+            # the label that left is now missing from both tableaux, so it enters the other one
+            entering = leaving
+            current = 1 - current
+
+        x = np.zeros(m)
+        for row, label in enumerate(basis_0):
+            if label < m:
+                x[label] = tableau_0[row, -1]
+        y = np.zeros(n)
+        for row, label in enumerate(basis_1):
+            if label >= m:
+                y[label - m] = tableau_1[row, -1]
+        return [x / np.sum(x), y / np.sum(y)], iterations
+
+    def linear_program(self):
+        """
+        solves zero-sum and constant-sum games exactly, each player maximising their guaranteed payoff
+        :return: [strategy_0, strategy_1], number of iterations of the LP solver
+        """
+        from scipy.optimize import linprog  # only needed for this solver
+
+        total = self.payoff[0] + self.payoff[1]
+        if not np.allclose(total, total.flat[0]):
+            raise ValueError("The linear programming solver requires a zero-sum or constant-sum game.")
+        strategies, iterations = [], 0
+        # player 0 maximises v with payoff_0^T p >= v, player 1 maximises w with payoff_1 q >= w
+        for guaranteed in (self.payoff[0].T, self.payoff[1]):
+            k = guaranteed.shape[1]
+            result = linprog(
+                c=np.r_[np.zeros(k), -1],
+                A_ub=np.hstack([-guaranteed, np.ones((guaranteed.shape[0], 1))]),
+                b_ub=np.zeros(guaranteed.shape[0]),
+                A_eq=np.r_[np.ones(k), 0].reshape(1, -1),
+                b_eq=[1],
+                bounds=[(0, None)] * k + [(None, None)],
+                method="highs",
+            )
+            if not result.success:
+                raise RuntimeError(f"Linear program failed: {result.message}")
+            strategy = np.maximum(result.x[:k], 0)
+            strategies.append(strategy / np.sum(strategy))
+            iterations += result.nit
+        return strategies, iterations
+
+
+def pivot(tableau, basis, entering, initial_basis, tol=1e-12):
+    """
+    brings the variable with the entering label into the basis of a Lemke-Howson tableau in place,
+    breaking ties in the ratio test lexicographically
+    :param tableau: array of constraints, one column per label then the right hand side
+    :param basis: list of the label basic in each row, updated in place
+    :param entering: label entering the basis
+    :param initial_basis: labels of the starting basis, used for the lexicographic ratio test
+    :return: label leaving the basis
+    """
+    column = tableau[:, entering]
+    candidates = np.flatnonzero(column > tol)
+    # comparing the right hand side first, then the columns of the starting basis
+    for key in [tableau.shape[1] - 1] + list(initial_basis):
+        ratios = tableau[candidates, key] / column[candidates]
+        candidates = candidates[ratios <= np.min(ratios) + tol]
+        if len(candidates) == 1:
+            break
+    row = candidates[0]
+    leaving = basis[row]
+    tableau[row] /= tableau[row, entering]
+    for other in range(len(tableau)):
+        if other != row:
+            tableau[other] -= tableau[other, entering] * tableau[row]
+    basis[row] = entering
+    return leaving
+
+
+# solvers available to MixedEquilibriumFinder.solve, each called with the finder and keyword arguments
+# and returning [strategy_0, strategy_1] and the number of iterations taken
+SOLVERS = {
+    "nash": MixedEquilibriumFinder.nash_map,
+    "fictitious_play": MixedEquilibriumFinder.fictitious_play,
+    "replicator": MixedEquilibriumFinder.replicator_dynamics,
+    "lemke_howson": MixedEquilibriumFinder.lemke_howson,
+    "linear_program": MixedEquilibriumFinder.linear_program,
+}
 
 
-#some preliminary tests
-payoff = np.array([[[1,2],[-1,3]],[[-2,1],[1,-1]]])
-starting_strategy_0 = np.array([2/5-0.001,3/5+0.001])
-starting_strategy_1 = np.array([1/3+0.001,2/3-0.001])
-ef = MixedEquilibriumFinder(payoff,starting_strategy_0,starting_strategy_1)
-print(ef.strategy)
-print(ef.payoff)
-print(ef.expected_payoff(0, ef.strategy))
-print(ef.find_equilibrium(0.0001,100000))
+if __name__ == "__main__":
+    #some preliminary tests
+    payoff = np.array([[[1,2],[-1,3]],[[-2,1],[1,-1]]])
+    starting_strategy_0 = np.array([2/5-0.001,3/5+0.001])
+    starting_strategy_1 = np.array([1/3+0.001,2/3-0.001])
+    ef = MixedEquilibriumFinder(payoff,starting_strategy_0,starting_strategy_1)
+    print(ef.strategy)
+    print(ef.payoff)
+    print(ef.expected_payoff(0, ef.strategy))
+    print(ef.find_equilibrium(0.0001,100000))
@@ -1,9 +1,14 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import scipy as sp
+import itertools
+import nD_equilibria_finder as nD
 
 # code for plotting payoff space of a 2-player game via monte carlo methods
 
+# bytes of working memory used per chunk by PayoffSampler.sample_stream
+SAMPLE_MEMORY = 2**26
+
 def orientation(p, q, r):
     val = (q[1] - p[1]) * (r[0] - q[0]) - (q[0] - p[0]) * (r[1] - q[1])
     if val == 0:
@@ -47,6 +52,21 @@ def is_convex_combination(x, vertices):
     return True
 
 
+def in_convex_hull(points, hull):
+    """
+    vectorised test of which points lie in a convex polygon (boundary included)
+    :param points: numpy array of shape (N, 2)
+    :param hull: numpy array of shape (k, 2), vertices in the counterclockwise order given by graham_scan
+    :return: boolean numpy array of shape (N,)
+    """
+    inside = np.ones(len(points), dtype=bool)
+    for p1, p2 in zip(hull, np.roll(hull, -1, axis=0)):
+        # a point is inside when it is never to the right of an edge
+        cross = (p2[0] - p1[0]) * (points[:, 1] - p1[1]) - (p2[1] - p1[1]) * (points[:, 0] - p1[0])
+        inside &= cross >= 0
+    return inside
+
+
 class PayoffSampler:
     def __init__(self, payoffs, n_A=None, seed=1):
         """
@@ -79,90 +99,585 @@ class PayoffSampler:
         self.pureStrats = range(len(payoffs))
         # sampler using given seed
         self.rng = np.random.default_rng(seed)
+        # convex hull of the pure payoffs, computed once for the uniform samplers
+        # payoffs collinear up to rounding, as in constant-sum games, give a segment rather than a sliver
+        self.hull = robust_hull(np.array(payoffs, dtype=float).reshape(-1, 2))
 
-    def sample_naive(self, N):
+    def sample_naive(self, N, dirichlet=False, chunk_size=None):
         """
-        draw N samples and return expected payoffs as list of tuples of length N
+        draw N samples and return expected payoffs as an array
         :param N: number of samples to draw
-        :return: samples as list of tuples
+        :param dirichlet: if True strategies are uniform on the simplex, otherwise uniform weights are normalised
+        :param chunk_size: number of samples drawn at once, defaults to fit in SAMPLE_MEMORY
+        :return: samples as numpy array of shape (N, 2)
         """
-        samples = []  # list of tuples giving expected payoffs from playing random strategies
-        for i in range(N):
-            # sample random probabilities of each strategy
-            bStratProbs = self.rng.uniform(low=0, high=1, size=self.n_B)
-            bStratProbs = bStratProbs/sum(bStratProbs)  # normalise to give probabilities
-            aStratProbs = self.rng.uniform(low=0, high=1, size=self.n_A)
-            aStratProbs = aStratProbs/sum(aStratProbs)  # normalise to give probabilities
-
-            # forming expected strategies by law of total expectation
-            A_payoff, B_payoff = 0, 0
-            for k, pA in enumerate(aStratProbs):
-                for l, pB in enumerate(bStratProbs):
-                    A_payoff += pA*pB*self.payoffs_A[k, l]
-                    B_payoff += pA*pB*self.payoffs_B[k, l]
-
-            samples.append((A_payoff, B_payoff))
-
+        samples = np.empty((N, 2))
+        start = 0
+        for chunk in self.sample_stream(N, dirichlet, chunk_size):
+            samples[start:start + len(chunk)] = chunk
+            start += len(chunk)
         return samples
 
-    def sample_rejection(self, N):
+    def sample_stream(self, N, dirichlet=False, chunk_size=None):
+        """
+        draws N samples a chunk at a time, so memory use stays fixed however many are drawn
+        :param N: number of samples to draw
+        :param dirichlet: as in sample_naive
+        :param chunk_size: number of samples per chunk, defaults to fit in SAMPLE_MEMORY
+        :return: generator of numpy arrays of shape (chunk_size, 2), the last possibly shorter
+        """
+        if chunk_size is None:  # floats held per sample: both strategies and player A's intermediate product
+            chunk_size = max(1, SAMPLE_MEMORY // (8 * (self.n_A + 3 * self.n_B)))
+        for start in range(0, N, chunk_size):
+            size = min(chunk_size, N - start)
+            aStratProbs = self.sample_strategies(self.n_A, size, dirichlet)
+            bStratProbs = self.sample_strategies(self.n_B, size, dirichlet)
+            # expected payoffs by law of total expectation, p_A^T P p_B for each sample
+            chunk = np.empty((size, 2))
+            chunk[:, 0] = np.einsum("ij,ij->i", aStratProbs @ self.payoffs_A, bStratProbs)
+            chunk[:, 1] = np.einsum("ij,ij->i", aStratProbs @ self.payoffs_B, bStratProbs)
+            yield chunk
+
+    def sample_strategies(self, n, size, dirichlet=False):
+        """
+        :param n: number of pure strategies
+        :param size: number of mixed strategies to draw
+        :param dirichlet: as in sample_naive
+        :return: numpy array of shape (size, n), each row a probability vector
+        """
+        if dirichlet:  # normalised exponentials are Dirichlet(1, ..., 1), i.e. uniform on the simplex
+            probs = self.rng.standard_exponential((size, n))
+        else:
+            probs = self.rng.uniform(low=0, high=1, size=(size, n))
+        return probs / probs.sum(axis=1, keepdims=True)  # normalise to give probabilities
+
+    def sample_rejection(self, N, batch_size=None, max_batches=None):
         """
         uses rejection sampling to sample uniformly from convex hull
-        this should constitute a speedup to sample_naive, which is not uniform so fills area very slowly
+        proposals are drawn from the bounding box in batches and tested against the hull all at once
         :param N: number of samples to draw
-        :return: samples as list of tuples
+        :param batch_size: proposals per batch, defaults to 2N
+        :param max_batches: number of batches after which to give up, defaults to 100
+        :return: samples as numpy array of shape (N, 2)
+        :raises RuntimeError: if fewer than N proposals are accepted within max_batches
         """
-        print("The sample_rejection method will NOT sample from payoff set... It will be fixed at some point.")
+        if len(self.hull) < 3:  # hull has no area, so no proposal would ever be accepted
+            return self.sample_uniform(N)
         # obtaining bounds of box within which to sample
-        max_x, min_x = np.max(self.payoffs_A), np.min(self.payoffs_A)
-        max_y, min_y = np.max(self.payoffs_B), np.min(self.payoffs_B)
+        min_x, min_y = np.min(self.hull, axis=0)
+        max_x, max_y = np.max(self.hull, axis=0)
+        batch_size = batch_size or max(1, 2 * N)
 
-        samples = []
+        samples = np.empty((N, 2))
+        found = 0
         nits = 0  # iteration counter
-        while len(samples) < N and nits <= 10*N:
-            x = self.rng.uniform(low=min_x, high=max_x, size=1)
-            y = self.rng.uniform(low=min_y, high=max_y, size=1)
-
-            proposal = (x, y)
-
-            if is_convex_combination(proposal, self.payoffs):
-                samples.append(proposal)
-
+        while found < N and nits < (max_batches or 100):
+            proposals = np.column_stack([self.rng.uniform(low=min_x, high=max_x, size=batch_size),
+                                         self.rng.uniform(low=min_y, high=max_y, size=batch_size)])
+            accepted = proposals[in_convex_hull(proposals, self.hull)][:N - found]
+            samples[found:found + len(accepted)] = accepted
+            found += len(accepted)
+            nits += 1
+
+        if found < N:
+            raise RuntimeError(f"Only {found} of {N} samples accepted in {nits} batches, "
+                               f"raise batch_size or max_batches, or use sample_uniform.")
         return samples
 
+    def sample_uniform(self, N):
+        """
+        samples exactly uniformly from the convex hull, by splitting it into a fan of triangles,
+        choosing triangles in proportion to their area and sampling uniformly within each
+        :param N: number of samples to draw
+        :return: samples as numpy array of shape (N, 2)
+        """
+        hull = self.hull
+        if len(hull) == 1:
+            return np.repeat(hull, N, axis=0)
+        if len(hull) == 2:  # collinear payoffs, the hull is a segment
+            return hull[0] + self.rng.uniform(size=(N, 1)) * (hull[1] - hull[0])
+
+        a, b, c = hull[0], hull[1:-1], hull[2:]
+        areas = np.abs((b[:, 0] - a[0]) * (c[:, 1] - a[1]) - (b[:, 1] - a[1]) * (c[:, 0] - a[0]))
+        triangles = self.rng.choice(len(areas), size=N, p=areas / np.sum(areas))
+        u, v = self.rng.uniform(size=(2, N, 1))
+        # points with u + v > 1 fall in the other half of the parallelogram, reflecting maps them back
+        flip = (u + v > 1)
+        u = np.where(flip, 1 - u, u)
+        v = np.where(flip, 1 - v, v)
+        return a + u * (b[triangles] - a) + v * (c[triangles] - a)
+
+
+def robust_hull(points, tol=1e-9):
+    """
+    convex hull of a large set of points using Qhull, falling back to graham_scan for too few points;
+    points collinear up to rounding give the two ends of their segment
+    :param points: numpy array of shape (N, 2)
+    :param tol: relative width below which the points are treated as collinear
+    :return: numpy array of hull vertices in counterclockwise order, as graham_scan
+    """
+    from scipy.spatial import ConvexHull
+
+    points = np.unique(np.asarray(points, dtype=float), axis=0)
+    if len(points) < 3:
+        return np.array(graham_scan([tuple(p) for p in points])).reshape(-1, 2)
+    centred = points - points.mean(axis=0)
+    _, widths, directions = np.linalg.svd(centred, full_matrices=False)
+    if widths[1] <= tol * widths[0]:
+        along = centred @ directions[0]
+        return points[[np.argmin(along), np.argmax(along)]]
+    return points[ConvexHull(points).vertices]  # counterclockwise for 2D input
+
+
+def cross(u, v):
+    """
+    z component of the cross product of arrays of 2D vectors
+    """
+    return u[..., 0] * v[..., 1] - u[..., 1] * v[..., 0]
+
+
+def in_polygon(points, polygon, tol=0.0):
+    """
+    vectorised even-odd test of which points lie inside a (possibly non-convex) polygon, boundary included
+    :param points: numpy array of shape (N, 2)
+    :param polygon: numpy array of shape (k, 2) of vertices in order
+    :param tol: points at most this far from an edge count as inside
+    :return: boolean numpy array of shape (N,)
+    """
+    inside = np.zeros(len(points), dtype=bool)
+    on_edge = np.zeros(len(points), dtype=bool)
+    x, y = points[:, 0], points[:, 1]
+    for p1, p2 in zip(polygon, np.roll(polygon, -1, axis=0)):
+        (x1, y1), (x2, y2) = p1, p2
+        # each edge crossed by a horizontal ray to the right of the point toggles inside
+        crosses = (y1 > y) != (y2 > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+        inside ^= crosses & (x < x_cross)
+    # the ray test is decided by rounding on the edge itself, so those points are found by distance
+    on_edge |= segment_distance(points, polygon, np.roll(polygon, -1, axis=0)).min(axis=1) <= tol
+    return inside | on_edge
+
+
+def polygon_area(polygon):
+    """
+    :param polygon: numpy array of shape (k, 2) of vertices in order
+    :return: signed area, positive when the vertices run counterclockwise
+    """
+    return cross(polygon, np.roll(polygon, -1, axis=0)).sum() / 2
+
+
+def segment_distance(points, starts, ends):
+    """
+    :param points: numpy array of shape (N, 2)
+    :param starts: numpy array of shape (E, 2), one end of each segment
+    :param ends: numpy array of shape (E, 2), the other end of each segment
+    :return: numpy array of shape (N, E), distance from each point to each segment
+    """
+    edges = ends - starts
+    offsets = points[:, None, :] - starts
+    lengths = np.maximum((edges * edges).sum(axis=1), np.finfo(float).tiny)
+    along = np.clip((offsets * edges).sum(axis=2) / lengths, 0, 1)
+    return np.linalg.norm(offsets - along[..., None] * edges, axis=2)
+
+
+def unique_segments(segments):
+    """
+    :param segments: numpy array of shape (E, 2, 2)
+    :return: the distinct segments of positive length, each with its lexicographically smaller end first
+    """
+    start, end = segments[:, 0], segments[:, 1]
+    flip = (start[:, 0] > end[:, 0]) | ((start[:, 0] == end[:, 0]) & (start[:, 1] > end[:, 1]))
+    segments = np.where(flip[:, None, None], segments[:, ::-1], segments)
+    segments = segments[np.any(segments[:, 0] != segments[:, 1], axis=1)]
+    return np.unique(segments.reshape(-1, 4), axis=0).reshape(-1, 2, 2)
+
+
+def chain_loops(starts, ends):
+    """
+    joins directed segments into closed loops, following at each vertex the next unused segment leaving it
+    :param starts: numpy array of shape (E, 2)
+    :param ends: numpy array of shape (E, 2), each end equal to the start of another segment
+    :return: list of numpy arrays of shape (k, 2), the vertices of each loop in order
+    """
+    vertices, ids = np.unique(np.concatenate([starts, ends]), axis=0, return_inverse=True)
+    ids = ids.ravel()
+    first, last = ids[:len(starts)], ids[len(starts):]
+    leaving = {}
+    for e, v in enumerate(first):
+        leaving.setdefault(v, []).append(e)
+    loops = []
+    for v0 in list(leaving):
+        while leaving[v0]:
+            loop = [v0]
+            v = last[leaving[v0].pop()]
+            while v != v0 and leaving.get(v):
+                loop.append(v)
+                v = last[leaving[v].pop()]
+            loops.append(vertices[loop])
+    return loops
+
+
+def drop_collinear(loop, tol=1e-12):
+    """
+    :param loop: numpy array of shape (k, 2) of vertices in order
+    :param tol: sine of the turning angle below which a vertex is dropped
+    :return: the loop without vertices lying straight between their neighbours
+    """
+    before, after = loop - np.roll(loop, 1, axis=0), np.roll(loop, -1, axis=0) - loop
+    sine = np.abs(cross(before, after))
+    keep = (sine > tol * np.linalg.norm(before, axis=1) * np.linalg.norm(after, axis=1)) | \
+        (np.sum(before * after, axis=1) < 0)  # a loop doubling back on itself keeps the turn
+    return loop[keep] if np.count_nonzero(keep) >= 3 else loop
+
+
+def pad_rows(arrays):
+    """
+    :param arrays: list of numpy arrays of shapes (k_i, ...)
+    :return: numpy array of shape (len(arrays), max k_i, ...), each array padded by repeating its last row
+    """
+    size = max(len(array) for array in arrays)
+    return np.array([np.concatenate([array, np.repeat(array[-1:], size - len(array), axis=0)])
+                     for array in arrays])
+
+
+def doubling_groups(n):
+    """
+    splits range(n) into groups of sizes 1, 2, 4, ..., so that work stopping early stays small
+    :return: generator of (begin, stop) pairs
+    """
+    begin, size = 0, 1
+    while begin < n:
+        yield begin, min(begin + size, n)
+        begin, size = begin + size, 2 * size
+
+
+def box_pairs(low, high, lower, upper, cost=1, budget=2**22):
+    """
+    pairs of items and boxes where the item's box [low, high] lies within [lower, upper]
+    :param low: numpy array of shape (N, 2), lower corners of the items
+    :param high: numpy array of shape (N, 2), upper corners of the items
+    :param lower: numpy array of shape (K, 2), lower corners of the boxes
+    :param upper: numpy array of shape (K, 2), upper corners of the boxes
+    :param cost: array elements used per pair, which sets the number of pairs yielded at once
+    :param budget: number of array elements to work with at once
+    :return: generator of (item indices, box indices) pairs of arrays
+    """
+    block = max(1, budget // len(lower))
+    for begin in range(0, len(low), block):
+        near = np.all((low[begin:begin + block, None] >= lower) & (high[begin:begin + block, None] <= upper),
+                      axis=2)
+        item, box = np.nonzero(near)
+        item += begin
+        step = max(1, budget // cost)
+        for first in range(0, len(item), step):
+            yield item[first:first + step], box[first:first + step]
+
+
+class PayoffRegion:
+    """
+    Exact set of payoffs reachable with mixed strategies, for the game of a PayoffSampler.
+    Sweeping one player's strategy along an edge of their simplex moves the other player's
+    convex set of payoffs, and a moving convex set only covers new ground with its edges. Applying this
+    to both players, every reachable payoff lies either in the convex hull of one row or one column of
+    pure payoffs, or in the image of the strategy square of a 2x2 subgame under its bilinear payoff map.
+    Each such image is split along the fold line where the map's Jacobian vanishes: lines of the square
+    map to straight segments and the fold line maps to a parabolic arc, so each piece is a polygon once
+    the arc is sampled. The region is the union of the pieces, and boundary traces its outline.
+    When all pure payoffs are collinear, as in constant sum games, the region is their hull segment.
+    """
+
+    def __init__(self, sampler, arc_points=16):
+        """
+        :param sampler: PayoffSampler holding the game
+        :param arc_points: number of vertices used for each fold arc
+        """
+        self.sampler = sampler
+        self.arc_points = arc_points
+        # payoff vectors of the pure strategy pairs, shape (n_A, n_B, 2)
+        pure = np.stack([sampler.payoffs_A, sampler.payoffs_B], axis=-1).astype(float)
+        self.hull = robust_hull(pure.reshape(-1, 2))
+        self.scale = max(np.ptp(self.hull, axis=0).max(), 1e-12)
+        # distance from the region within which a payoff counts as reachable, allowing for rounding
+        self.tol = 1e-9 * self.scale
+        self.polygons = []
+        self._boundary = None
+        if len(self.hull) < 3:  # every piece lies on the hull segment, which is then the whole region
+            return
+
+        pieces = [robust_hull(line) for line in list(pure) + list(pure.transpose(1, 0, 2))]
+        rows = np.array(list(itertools.combinations(range(sampler.n_A), 2)) or [(0, 0)])
+        columns = np.array(list(itertools.combinations(range(sampler.n_B), 2)) or [(0, 0)])
+        i, k = np.repeat(rows, len(columns), axis=0).T
+        j, l = np.tile(columns, (len(rows), 1)).T
+        p00, p01, p10, p11 = pure[i, j], pure[i, l], pure[k, j], pure[k, l]
+        # the bilinear map is p00 + s a + t b + s t c, its Jacobian k0 + k1 s + k2 t is linear
+        a, b, c = p10 - p00, p01 - p00, p11 - p10 - p01 + p00
+        k0, k1, k2 = cross(a, b), cross(a, c), cross(c, b)
+        square = np.array([[0, 0], [1, 0], [1, 1], [0, 1]], dtype=float)
+        jacobian = k0[:, None] + np.stack([k1, k2], axis=1) @ square.T
+        # the Jacobian scales with the square of the payoffs, rounding below this is not a fold
+        folded = (jacobian.min(axis=1) < -1e-12 * self.scale**2) & (jacobian.max(axis=1) > 1e-12 * self.scale**2)
+        # without a fold the map is one to one, and the image is the quadrilateral of the corners
+        pieces.extend(np.stack([p00, p10, p11, p01], axis=1)[~folded])
+        for f in np.flatnonzero(folded):
+            pieces.extend(self.subgame_polygons(p00[f], p01[f], p10[f], p11[f]))
+
+        # pieces without area, e.g. images of subgames whose payoffs are collinear, are dropped, which
+        # ignores any part of a region with area that is only a curve; equal payoffs repeat pieces exactly
+        unique = {}
+        for piece in pieces:
+            piece = piece[np.any(piece != np.roll(piece, -1, axis=0), axis=1)]  # repeated vertices
+            area = polygon_area(piece)
+            if abs(area) > self.tol * self.scale:
+                piece = np.ascontiguousarray(piece if area > 0 else piece[::-1])  # counterclockwise
+                unique.setdefault(piece.tobytes(), piece)
+        self.polygons = sorted(unique.values(), key=polygon_area, reverse=True)
+        # largest first, as those settle most tests; bounding boxes skip pieces far from each other
+        self.lower = np.array([polygon.min(axis=0) for polygon in self.polygons])
+        self.upper = np.array([polygon.max(axis=0) for polygon in self.polygons])
+
+    def subgame_polygons(self, p00, p01, p10, p11):
+        """
+        image of the strategy square of a 2x2 subgame as at most two polygons, one each side of the fold
+        :param p00: payoff vector when player A plays the first row and B the first column, etc.
+        :return: list of numpy arrays of shape (k, 2)
+        """
+        a, b, c = p10 - p00, p01 - p00, p11 - p10 - p01 + p00
+
+        def payoff_map(st):
+            s, t = st[:, :1], st[:, 1:]
+            return p00 + s * a + t * b + s * t * c
+
+        k0, k1, k2 = cross(a, b), cross(a, c), cross(c, b)
+        square = np.array([[0, 0], [1, 0], [1, 1], [0, 1]], dtype=float)
+        jacobian = k0 + square @ np.array([k1, k2])
+        pieces = []
+        for sign in (1, -1):
+            piece = []
+            for p, q, jp, jq in zip(square, np.roll(square, -1, axis=0), jacobian, np.roll(jacobian, -1)):
+                # clipping the square to the half plane sign * jacobian >= 0
+                if sign * jp >= 0:
+                    piece.append(p)
+                if jp * jq < 0:
+                    piece.append(p + (q - p) * jp / (jp - jq))
+            pieces.append(payoff_map(self.with_fold(np.array(piece), k0, k1, k2)))
+        return pieces
+
+    def with_fold(self, piece, k0, k1, k2):
+        """
+        adds points along the fold edge of a piece of the clipped square, where the fold maps to an arc
+        :param piece: numpy array of (s, t) vertices of a convex piece on one side of the fold line
+        :return: numpy array of (s, t) vertices
+        """
+        on_fold = np.abs(k0 + piece @ np.array([k1, k2])) <= 1e-9 * max(abs(k0), abs(k1), abs(k2))
+        for i in range(len(piece)):
+            j = (i + 1) % len(piece)
+            if on_fold[i] and on_fold[j]:
+                fold = piece[i] + np.linspace(0, 1, self.arc_points + 2)[1:-1, None] * (piece[j] - piece[i])
+                return np.concatenate([piece[:i + 1], fold, piece[i + 1:]])
+        return piece
+
+    def covered(self, points):
+        """
+        even-odd test of which points lie inside any piece
+        :param points: numpy array of shape (N, 2)
+        :return: boolean numpy array of shape (N,)
+        """
+        points = np.asarray(points, dtype=float)
+        covered = np.zeros(len(points), dtype=bool)
+        # the largest pieces come first and cover most points, which are then not tested again
+        for begin, stop in doubling_groups(len(self.polygons)):
+            todo = np.flatnonzero(~covered)
+            if not len(todo):
+                break
+            starts = pad_rows(self.polygons[begin:stop])  # repeated last vertices add empty edges
+            ends = np.roll(starts, -1, axis=1)
+            batch = points[todo]
+            for point, piece in box_pairs(batch, batch, self.lower[begin:stop], self.upper[begin:stop],
+                                          starts.shape[1]):
+                x, y = batch[point, :1], batch[point, 1:]
+                x1, y1, x2, y2 = starts[piece, :, 0], starts[piece, :, 1], ends[piece, :, 0], ends[piece, :, 1]
+                crosses = (y1 > y) != (y2 > y)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+                inside = np.count_nonzero(crosses & (x < x_cross), axis=1) % 2 == 1
+                covered[todo[point[inside]]] = True
+        return covered
+
+    def inside_convex_piece(self, edges):
+        """
+        which edges lie strictly inside a convex piece, and so are not on the boundary; a cheap filter
+        that spares split_edges most of the interior edges
+        :param edges: numpy array of shape (E, 2, 2)
+        :return: boolean numpy array of shape (E,)
+        """
+        inside = np.zeros(len(edges), dtype=bool)
+        # each convex piece as its edges, (start, unit direction), counterclockwise
+        convex = []
+        for polygon in self.polygons:
+            direction = np.roll(polygon, -1, axis=0) - polygon
+            if cross(direction, np.roll(direction, -1, axis=0)).min() >= -self.tol * self.scale:
+                convex.append(np.stack([polygon, direction / np.linalg.norm(direction, axis=1)[:, None]], axis=1))
+        lower = np.array([piece[:, 0].min(axis=0) for piece in convex]).reshape(-1, 2)
+        upper = np.array([piece[:, 0].max(axis=0) for piece in convex]).reshape(-1, 2)
+        for begin, stop in doubling_groups(len(convex)):
+            todo = np.flatnonzero(~inside)
+            if not len(todo):
+                break
+            pieces = pad_rows(convex[begin:stop])  # repeated last edges change nothing
+            for edge, piece in box_pairs(edges[todo].min(axis=1), edges[todo].max(axis=1), lower[begin:stop],
+                                         upper[begin:stop], 2 * pieces.shape[1]):
+                starts, units = pieces[piece, :, 0], pieces[piece, :, 1]
+                # distance of both ends to the left of every edge of the piece
+                margin = cross(units[:, None], edges[todo[edge]][:, :, None] - starts[:, None])
+                inside[todo[edge[np.all(margin > self.tol, axis=(1, 2))]]] = True
+        return inside
+
+    def split_edges(self, edges):
+        """
+        splits edges where they cross or where another edge ends on them, so each part lies either
+        on the boundary or off it; vertices are rounded to a grid of tol so that parts meet exactly
+        :param edges: numpy array of shape (E, 2, 2)
+        :return: numpy array of shape (F, 2, 2) of distinct parts
+        """
+        a, d = edges[:, 0], edges[:, 1] - edges[:, 0]
+        length = np.linalg.norm(d, axis=1)
+        lower, upper = edges.min(axis=1) - self.tol, edges.max(axis=1) + self.tol
+        # each part runs between consecutive points along its edge, its ends included
+        index, along, points = [np.arange(len(edges))] * 2, [np.zeros(len(edges)), np.ones(len(edges))], \
+            [edges[:, 0], edges[:, 1]]
+        block = max(1, 2**22 // len(edges))
+        for begin in range(0, len(edges), block):
+            near = np.all((lower[begin:begin + block, None] <= upper) & (upper[begin:begin + block, None] >= lower),
+                          axis=2)
+            i, j = np.nonzero(near)
+            i += begin
+            i, j = i[i < j], j[i < j]
+            denominator = cross(d[i], d[j])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                t = cross(a[j] - a[i], d[j]) / denominator
+                u = cross(a[j] - a[i], d[i]) / denominator
+            # crossings away from both edges' ends, for edges not parallel up to rounding
+            proper = (np.abs(denominator) > 1e-9 * length[i] * length[j]) & \
+                (t * length[i] > self.tol) & ((1 - t) * length[i] > self.tol) & \
+                (u * length[j] > self.tol) & ((1 - u) * length[j] > self.tol)
+            crossing = a[i[proper]] + t[proper, None] * d[i[proper]]
+            index += [i[proper], j[proper]]
+            along += [t[proper], u[proper]]
+            points += [crossing, crossing]
+            for e, f in ((i, j), (j, i)):
+                for end in (edges[f, 0], edges[f, 1]):
+                    s = np.sum((end - a[e]) * d[e], axis=1) / length[e]**2
+                    on = (np.abs(cross(d[e], end - a[e])) <= self.tol * length[e]) & \
+                        (s * length[e] > self.tol) & ((1 - s) * length[e] > self.tol)
+                    index.append(e[on])
+                    along.append(s[on])
+                    points.append(end[on])
+
+        index, along, points = np.concatenate(index), np.concatenate(along), np.concatenate(points)
+        points = np.round(points / self.tol) * self.tol
+        order = np.lexsort((along, index))
+        index, points = index[order], points[order]
+        same = index[1:] == index[:-1]
+        return unique_segments(np.stack([points[:-1][same], points[1:][same]], axis=1))
+
+    def boundary(self):
+        """
+        outline of the region as closed loops, outer loops counterclockwise and holes clockwise, so the
+        region lies to the left of every edge; computed once, as the parts of the pieces' edges with the
+        region on one side only
+        :return: list of numpy arrays of shape (k, 2) of vertices in order, or the hull segment (or point)
+            alone when the region has no area
+        """
+        if self._boundary is None:
+            self._boundary = self.trace_boundary() if self.polygons else [self.hull]
+        return self._boundary
 
-# function to generate payoffs for 1d election game
-def get_election_payoffs(n):
-
-    payoffs = []
-    # loop of possible strategies of each of candidates A and B
-    for i, aStrat in enumerate(range(n)):
-        for j, bStrat in enumerate(range(n)):
-            aPay = 0
-            bPay = 0
-            # for each point on the political spectrum
-            for k in range(n):
-                aDist = abs(aStrat-k)
-                bDist = abs(bStrat-k)
-                if aDist < bDist:
-                    bPay += 1/n
-                elif bDist < aDist:
-                    aPay += 1/n
-                else:  # equidistant cast, half payoff
-                    aPay += 1/(2*n)
-                    bPay += 1/(2*n)
-
-            payoffs.append((aPay, bPay))
-
-    return payoffs
-
-
-v = 2
-c = 3
-
-payoffs = [((v-c)/2, -(v-c)/2), (v, 0), (0, 0), (v + 5, v/2)]
-sampler = PayoffSampler(payoffs, n_A=2, seed=1)
-convex_hull = sampler.sample_naive(1000)
-plt.scatter([t[0] for t in convex_hull], [t[1] for t in convex_hull], s=0.5, color="red")
-plt.show()
+    def trace_boundary(self, eps=1e-7):
+        """
+        :param eps: offset of the points testing either side of each part, relative to the size of the region
+        :return: list of loops, as boundary
+        """
+        edges = unique_segments(np.concatenate([np.stack([polygon, np.roll(polygon, -1, axis=0)], axis=1)
+                                                for polygon in self.polygons]))
+        edges = self.split_edges(edges[~self.inside_convex_piece(edges)])
+        direction = edges[:, 1] - edges[:, 0]
+        normal = np.column_stack([-direction[:, 1], direction[:, 0]]) / np.linalg.norm(direction, axis=1)[:, None]
+        midpoints = edges.mean(axis=1)
+        left = self.covered(midpoints + eps * self.scale * normal)
+        right = self.covered(midpoints - eps * self.scale * normal)
+        edges, right = edges[left != right], right[left != right]
+        edges[right] = edges[right, ::-1]  # region on the left
+        loops = [drop_collinear(loop) for loop in chain_loops(edges[:, 0], edges[:, 1])]
+        return sorted(loops, key=lambda loop: abs(polygon_area(loop)), reverse=True)
+
+    def contains(self, points):
+        """
+        :param points: numpy array of shape (N, 2)
+        :return: boolean numpy array of shape (N,), True for reachable payoffs, boundary included
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        loops = self.boundary()
+        starts = np.concatenate(loops)
+        ends = np.concatenate([np.roll(loop, -1, axis=0) for loop in loops])
+        inside = np.zeros(len(points), dtype=bool)
+        block = max(1, 2**22 // len(starts))
+        for begin in range(0, len(points), block):
+            batch = points[begin:begin + block]
+            near = segment_distance(batch, starts, ends).min(axis=1) <= self.tol
+            if self.polygons:  # even-odd test against every loop at once, holes included
+                x, y = batch[:, :1], batch[:, 1:]
+                (x1, y1), (x2, y2) = starts.T, ends.T
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+                near |= np.count_nonzero(((y1 > y) != (y2 > y)) & (x < x_cross), axis=1) % 2 == 1
+            inside[begin:begin + block] = near
+        return inside
+
+    def plot(self, ax=None, **kwargs):
+        """
+        fills the region bounded by its boundary loops, or draws the segment of a region without area
+        :param ax: matplotlib axes, defaults to the current axes
+        :param kwargs: passed to matplotlib.patches.PathPatch, or to ax.plot for a region without area
+        :return: the PathPatch added, or the list of lines from ax.plot
+        """
+        from matplotlib.path import Path
+        from matplotlib.patches import PathPatch
+
+        ax = ax or plt.gca()
+        if not self.polygons:
+            kwargs.setdefault("marker", "o" if len(self.hull) == 1 else None)
+            return ax.plot(self.hull[:, 0], self.hull[:, 1], **kwargs)
+        kwargs.setdefault("linewidth", 0)
+        path = Path.make_compound_path(*[Path(np.concatenate([loop, loop[:1]]), closed=True)
+                                         for loop in self.boundary()])
+        patch = ax.add_patch(PathPatch(path, **kwargs))
+        ax.autoscale_view()
+        return patch
+
+
+# function to generate payoffs for the election game
+def get_election_payoffs(n, dimensions=1):
+    """
+    payoffs of the two candidate election game on an n^dimensions grid, from the shared kernel
+    nD_equilibria_finder.election_payoffs; row k of the table is (A's payoff, B's payoff) with A on
+    position k // n^dimensions and B on position k % n^dimensions, as PayoffSampler reads it
+    :param n: number of positions along each dimension
+    :param dimensions: number of dimensions
+    :return: numpy array of shape (n^(2 dimensions), 2), listed row-wise from the table
+    """
+    payoffs_0, payoffs_1 = nD.election_payoffs(n, dimensions)
+    return np.column_stack([payoffs_0.ravel(), payoffs_1.ravel()])
+
+
+if __name__ == "__main__":
+    v = 2
+    c = 3
+
+    payoffs = [((v-c)/2, -(v-c)/2), (v, 0), (0, 0), (v + 5, v/2)]
+    sampler = PayoffSampler(payoffs, n_A=2, seed=1)
+    convex_hull = sampler.sample_naive(1000)
+    plt.scatter(convex_hull[:, 0], convex_hull[:, 1], s=0.5, color="red")
+    plt.show()
 
@@ -0,0 +1,253 @@
+# benchmarks of payoff construction, equilibrium search and sampling
+# run with: python benchmarks.py --output results.json [--baseline baseline.json]
+
+import numpy as np
+import argparse
+import importlib
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import nD_equilibria_finder as nD
+import payoff_cache
+from PayoffPlotter import PayoffSampler
+
+# the module names start with a digit, so they cannot be imported with an import statement
+one_dim = importlib.import_module("1D_equilibria_finder")
+mixed = importlib.import_module("2player_mixed_equilibria_finder")
+
+
+class BenchmarkCase:
+    """
+    A function timed for several sets of parameters.
+    """
+
+    def __init__(self, name, run, params, setup=None, units="profiles"):
+        """
+        :param name: name of the case, the key results are compared on together with the parameters
+        :param run: function taking the output of setup and returning the number of units of work done
+        :param params: list of dicts of keyword arguments, one benchmark per dict
+        :param setup: function taking the keyword arguments and returning the input of run, not timed,
+        defaults to passing the keyword arguments on as a dict
+        :param units: what the work returned by run counts, throughput is reported in units per second
+        """
+        self.name = name
+        self.run = run
+        self.params = params
+        self.setup = setup or (lambda **kwargs: kwargs)
+        self.units = units
+
+    def measure(self, params, repeats=3):
+        """
+        runs the case repeats times for wall time, then once more under tracemalloc for peak memory
+        (numpy reports its allocations to tracemalloc, so array memory is included)
+        :param params: keyword arguments for setup
+        :param repeats: number of timed runs, the fastest is kept
+        :return: dict of results
+        """
+        times = []
+        for _ in range(repeats):
+            state = self.setup(**params)  # set up again every run, as run may change its input
+            start = time.perf_counter()
+            work = self.run(state)
+            times.append(time.perf_counter() - start)
+        state = self.setup(**params)
+        tracemalloc.start()
+        self.run(state)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        wall_time = min(times)
+        return {
+            "name": self.name,
+            "params": params,
+            "wall_time": wall_time,
+            "median_time": float(np.median(times)),
+            "peak_memory": peak_memory,
+            "throughput": work / wall_time if wall_time > 0 else float("inf"),
+            "units": f"{self.units}/s",
+            "repeats": repeats,
+        }
+
+
+def payoff_finder_case(state):
+    payoff_tensor = nD.payoff_finder(state["num_positions"], state["dimensions"], state["num_players"],
+                                     state.get("metric", "l1"), cache=False)
+    return payoff_tensor.size
+
+
+def payoff_finder_one_dim_case(state):
+    payoff_tensors = one_dim.payoff_finder_one_dim(state["num_positions"], state["num_players"], cache=False)
+    return payoff_tensors[0].size
+
+
+def equilibria_setup(num_positions, dimensions, num_players):
+    return num_positions, dimensions, num_players, nD.payoff_finder(num_positions, dimensions, num_players, cache=False)
+
+
+def find_equilibria_case(state):
+    num_positions, dimensions, num_players, payoff_tensor = state
+    nD.find_equilibria(num_positions, dimensions, num_players, payoff_tensor)
+    return payoff_tensor.size
+
+
+def get_equilibria_for_players_case(state):
+    one_dim.get_equilibria_for_players(state["num_positions"], state["num_players"])
+    return state["num_positions"]**state["num_players"]
+
+
+def mixed_setup(num_positions, iterations):
+    payoffs_0, payoffs_1 = nD.election_payoffs(num_positions)
+    # a fixed random start, away from the symmetric point the map cannot leave
+    rng = np.random.default_rng(0)
+    start_0, start_1 = rng.dirichlet(np.ones(num_positions), size=2)
+    finder = mixed.MixedEquilibriumFinder(np.array([payoffs_0, payoffs_1]), start_0, start_1)
+    return finder, iterations
+
+
+def find_equilibrium_case(state):
+    finder, iterations = state
+    # a threshold of zero runs every iteration, so the work done is fixed
+    finder.find_equilibrium(0, iterations)
+    return finder.iterations
+
+
+def sampler_setup(num_strategies, samples, method):
+    # random payoffs, as the election game's are collinear and give a region without area
+    payoffs = np.random.default_rng(0).normal(size=(num_strategies**2, 2))
+    return PayoffSampler([tuple(p) for p in payoffs], n_A=num_strategies, seed=1), samples, method
+
+
+def sampler_case(state):
+    sampler, samples, method = state
+    if method == "dirichlet":
+        result = sampler.sample_naive(samples, dirichlet=True)
+    else:
+        result = getattr(sampler, f"sample_{method}")(samples)
+    return len(result)
+
+
+CASES = [
+    BenchmarkCase("payoff_finder", payoff_finder_case, [
+        {"num_positions": 1000, "dimensions": 1, "num_players": 2},
+        {"num_positions": 20, "dimensions": 2, "num_players": 2},
+        {"num_positions": 20, "dimensions": 2, "num_players": 2, "metric": "euclidean"},
+        {"num_positions": 10, "dimensions": 2, "num_players": 2, "metric": "linf"},
+        {"num_positions": 5, "dimensions": 2, "num_players": 3},
+        {"num_positions": 3, "dimensions": 3, "num_players": 3},
+    ]),
+    BenchmarkCase("payoff_finder_one_dim", payoff_finder_one_dim_case, [
+        {"num_positions": 100, "num_players": 2},
+        {"num_positions": 30, "num_players": 3},
+        {"num_positions": 11, "num_players": 4},
+    ]),
+    BenchmarkCase("find_equilibria", find_equilibria_case, [
+        {"num_positions": 20, "dimensions": 2, "num_players": 2},
+        {"num_positions": 5, "dimensions": 2, "num_players": 3},
+    ], setup=equilibria_setup),
+    BenchmarkCase("get_equilibria_for_players", get_equilibria_for_players_case, [
+        {"num_positions": 11, "num_players": 3},
+        {"num_positions": 11, "num_players": 4},
+    ]),
+    BenchmarkCase("MixedEquilibriumFinder.find_equilibrium", find_equilibrium_case, [
+        {"num_positions": 10, "iterations": 10000},
+        {"num_positions": 100, "iterations": 2000},
+    ], setup=mixed_setup, units="iterations"),
+    BenchmarkCase("PayoffSampler", sampler_case, [
+        {"num_strategies": 10, "samples": 100000, "method": "naive"},
+        {"num_strategies": 10, "samples": 100000, "method": "dirichlet"},
+        {"num_strategies": 10, "samples": 10000, "method": "rejection"},
+        {"num_strategies": 10, "samples": 100000, "method": "uniform"},
+    ], setup=sampler_setup, units="samples"),
+]
+
+
+def case_key(result):
+    return result["name"], json.dumps(result["params"], sort_keys=True)
+
+
+def run_benchmarks(cases=None, repeats=3, pattern=None, log=print):
+    """
+    :param cases: list of BenchmarkCase, defaults to CASES
+    :param repeats: number of timed runs of each benchmark
+    :param pattern: if given, only cases whose name contains it are run
+    :param log: function each result is passed to as a line of text, None for silence
+    :return: dict with the machine description under "machine" and the list of results under "results"
+    """
+    results = []
+    for case in cases or CASES:
+        if pattern and pattern not in case.name:
+            continue
+        for params in case.params:
+            result = case.measure(params, repeats)
+            results.append(result)
+            if log:
+                log(f"{case.name} {params}: {result['wall_time']:.4g}s, "
+                    f"{result['peak_memory'] / 2**20:.3g}MiB, {result['throughput']:.4g} {result['units']}")
+    machine = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    return {"machine": machine, "results": results}
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    compares results with a baseline run of the same cases
+    :param results: output of run_benchmarks
+    :param baseline: output of an earlier run_benchmarks, e.g. loaded from its JSON
+    :param tolerance: relative slow down in wall time or growth in peak memory flagged as a regression
+    :return: list of dicts, one per benchmark found in both, with the ratios to the baseline
+    and whether each is a regression
+    """
+    baseline_results = {case_key(result): result for result in baseline["results"]}
+    comparisons = []
+    for result in results["results"]:
+        old = baseline_results.get(case_key(result))
+        if old is None:
+            continue
+        time_ratio = result["wall_time"] / old["wall_time"]
+        memory_ratio = result["peak_memory"] / max(old["peak_memory"], 1)
+        comparisons.append({
+            "name": result["name"],
+            "params": result["params"],
+            "time_ratio": time_ratio,
+            "memory_ratio": memory_ratio,
+            "regression": time_ratio > 1 + tolerance or memory_ratio > 1 + tolerance,
+        })
+    return comparisons
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the election game code.")
+    parser.add_argument("--output", help="JSON file the results are written to")
+    parser.add_argument("--baseline", help="JSON file of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="relative change flagged as a regression")
+    parser.add_argument("--repeats", type=int, default=3, help="number of timed runs of each benchmark")
+    parser.add_argument("--filter", help="only run cases whose name contains this")
+    args = parser.parse_args(args)
+
+    # cached tensors would be timed instead of the code computing them
+    os.environ.pop(payoff_cache.CACHE_DIR_VARIABLE, None)
+    results = run_benchmarks(repeats=args.repeats, pattern=args.filter)
+    if args.baseline:
+        with open(args.baseline) as f:
+            results["comparison"] = compare(results, json.load(f), args.tolerance)
+        for comparison in results["comparison"]:
+            flag = "REGRESSION" if comparison["regression"] else "ok"
+            print(f"{flag}: {comparison['name']} {comparison['params']} time x{comparison['time_ratio']:.3g}, "
+                  f"memory x{comparison['memory_ratio']:.3g}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    # a non-zero exit status lets scripts stop on a regression
+    return int(any(comparison["regression"] for comparison in results.get("comparison", [])))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+# compact storage of payoff tensors, read back a chunk at a time
+
+import numpy as np
+import copy
+import json
+import math
+import zlib
+from collections import OrderedDict
+
+
+MAGIC = b"PAYOFFZ1"
+# number of tensor entries compressed together, a chunk is the unit read from disk
+CHUNK_ELEMENTS = 2**16
+
+
+def payoff_denominator(num_spots, num_players):
+    """
+    common denominator of every payoff of the uniformly weighted election game.
+    A space is split between c closest positions and then between the o players on a position,
+    and since the other c - 1 positions each hold a player, c - 1 + o <= num_players
+    :param num_spots: number of positions
+    :param num_players: number of players
+    :return: integer d such that every payoff times d is an integer
+    """
+    shares = [c * o for c in range(1, num_players + 1) for o in range(1, num_players + 2 - c)]
+    return num_spots * math.lcm(*shares)
+
+
+def encode_chunk(values, encoding, denominator, dtype, level):
+    """
+    :return: compressed bytes of a chunk of payoffs
+    """
+    if encoding == "rational":
+        numerators = np.rint(values * denominator)
+        if np.max(np.abs(values * denominator - numerators), initial=0) > 1e-6:
+            raise ValueError("Payoffs are not multiples of 1/denominator (e.g. a weighted electorate), "
+                             "use encoding='float32'.")
+        encoded = numerators.astype(dtype)
+    else:
+        encoded = values.astype(np.float32)
+    # storing the bytes of each significance together lets zlib find the repeats in the high bytes
+    shuffled = encoded.view(np.uint8).reshape(-1, encoded.itemsize).T
+    return zlib.compress(np.ascontiguousarray(shuffled).tobytes(), level)
+
+
+def save_compressed(path, payoff_tensor, encoding="rational", chunk_elements=CHUNK_ELEMENTS, level=6):
+    """
+    writes a payoff tensor compressed a chunk at a time, so memory-mapped tensors larger than RAM can be saved
+    :param path: file to write
+    :param payoff_tensor: C-contiguous tensor as from nD_equilibria_finder.payoff_finder
+    :param encoding: "rational" stores exact integer numerators over payoff_denominator, only valid for
+    uniformly weighted games; "float32" stores single precision values, compare them with rtol around 1e-6
+    :param chunk_elements: number of entries per compressed chunk
+    :param level: zlib compression level
+    """
+    if encoding not in ("rational", "float32"):
+        raise ValueError(f"Unknown encoding {encoding}, expected 'rational' or 'float32'.")
+    flat_payoffs = payoff_tensor.reshape(-1)
+    denominator = payoff_denominator(payoff_tensor.shape[0], payoff_tensor.ndim)
+    dtype = np.min_scalar_type(denominator) if encoding == "rational" else np.dtype(np.float32)
+    chunks = [encode_chunk(np.asarray(flat_payoffs[start:start + chunk_elements], dtype=float),
+                           encoding, denominator, dtype, level)
+              for start in range(0, flat_payoffs.size, chunk_elements)]
+    header = json.dumps({
+        "shape": payoff_tensor.shape,
+        "encoding": encoding,
+        "denominator": denominator,
+        "dtype": dtype.str,
+        "chunk_elements": chunk_elements,
+    }).encode()
+    offsets = np.cumsum([0] + [len(chunk) for chunk in chunks], dtype=np.uint64)
+    with open(path, "wb") as f:
+        # magic, header length, JSON header, chunk offsets, then the chunks
+        f.write(MAGIC)
+        f.write(np.uint64(len(header)).tobytes())
+        f.write(header)
+        f.write(offsets.tobytes())
+        for chunk in chunks:
+            f.write(chunk)
+
+
+class CompressedPayoffs:
+    """
+    Payoff tensor read from a file written by save_compressed, decompressing only the chunks a lookup needs.
+    Indexing with integers works as on the dense tensor: it gives a view of the remaining axes,
+    and a numpy array once a single axis is left, so find_best_responses can be given it directly.
+    """
+
+    def __init__(self, path, cache_chunks=64):
+        """
+        :param path: file written by save_compressed
+        :param cache_chunks: number of decompressed chunks kept, shared by every view of the file
+        """
+        data = np.memmap(path, dtype=np.uint8, mode="r")
+        if bytes(data[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a compressed payoff file.")
+        header_start = len(MAGIC) + 8
+        header_length = int(data[len(MAGIC):header_start].view(np.uint64)[0])
+        header = json.loads(bytes(data[header_start:header_start + header_length]))
+        self.encoding = header["encoding"]
+        self.denominator = header["denominator"]
+        self.stored_dtype = np.dtype(header["dtype"])
+        self.chunk_elements = header["chunk_elements"]
+        self.shape = tuple(header["shape"])
+        size = math.prod(self.shape)
+        num_chunks = -(-size // self.chunk_elements)
+        offsets_start = header_start + header_length
+        chunks_start = offsets_start + 8 * (num_chunks + 1)
+        self.offsets = chunks_start + data[offsets_start:chunks_start].view(np.uint64).astype(np.int64)
+        self.data = data
+        self.size = size
+        self.cache_chunks = cache_chunks
+        self.chunk_cache = OrderedDict()
+        self.offset = 0  # flat index of the first entry of this view
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def dtype(self):
+        return np.dtype(float)
+
+    @property
+    def nbytes(self):
+        """
+        :return: size in bytes of the compressed chunks
+        """
+        return int(self.offsets[-1] - self.offsets[0])
+
+    def chunk(self, k):
+        """
+        :param k: index of a chunk
+        :return: decoded payoffs in the chunk, as float64
+        """
+        if k in self.chunk_cache:
+            self.chunk_cache.move_to_end(k)
+            return self.chunk_cache[k]
+        raw = zlib.decompress(self.data[self.offsets[k]:self.offsets[k + 1]])
+        itemsize = self.stored_dtype.itemsize
+        shuffled = np.frombuffer(raw, dtype=np.uint8).reshape(itemsize, -1)
+        encoded = np.ascontiguousarray(shuffled.T).view(self.stored_dtype).reshape(-1)
+        values = encoded / self.denominator if self.encoding == "rational" else encoded.astype(float)
+        self.chunk_cache[k] = values
+        if len(self.chunk_cache) > self.cache_chunks:
+            self.chunk_cache.popitem(last=False)
+        return values
+
+    def read(self, start, stop):
+        """
+        :param start: first flat index of the view to read
+        :param stop: flat index to stop before
+        :return: array of the payoffs in the range
+        """
+        start, stop = start + self.offset, stop + self.offset
+        first, last = start // self.chunk_elements, (stop - 1) // self.chunk_elements
+        if first == last:
+            base = first * self.chunk_elements
+            return self.chunk(first)[start - base:stop - base].copy()
+        values = np.concatenate([self.chunk(k) for k in range(first, last + 1)])
+        base = first * self.chunk_elements
+        return values[start - base:stop - base]
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        """
+        :param key: integer or tuple of integers indexing the leading axes
+        :return: payoff if every axis is indexed, numpy array if one axis is left, else a view
+        """
+        key = key if isinstance(key, tuple) else (key,)
+        if len(key) > self.ndim:
+            raise IndexError(f"Too many indices for a tensor with {self.ndim} axes.")
+        offset = 0
+        for axis, index in enumerate(key):
+            if not isinstance(index, (int, np.integer)):
+                raise TypeError("Compressed payoffs can only be indexed with integers.")
+            if not -self.shape[axis] <= index < self.shape[axis]:
+                raise IndexError(f"Index {index} out of range for axis {axis} of length {self.shape[axis]}.")
+            offset = offset * self.shape[axis] + int(index) % self.shape[axis]
+        shape = self.shape[len(key):]
+        offset *= math.prod(shape)
+        if len(shape) == 0:
+            return float(self.read(offset, offset + 1)[0])
+        if len(shape) == 1:
+            return self.read(offset, offset + shape[0])
+        view = copy.copy(self)  # shares the file and the chunk cache
+        view.offset, view.shape, view.size = self.offset + offset, shape, math.prod(shape)
+        return view
+
+    def payoffs(self, profiles):
+        """
+        looks up many single payoffs at once, each chunk needed being decompressed once
+        :param profiles: integer array of shape (batch, ndim) of indices into the tensor
+        :return: array of shape (batch,)
+        """
+        flat = self.offset + np.ravel_multi_index(np.asarray(profiles).T, self.shape)
+        chunk_ids = flat // self.chunk_elements
+        values = np.empty(len(flat))
+        for k in np.unique(chunk_ids):
+            in_chunk = chunk_ids == k
+            values[in_chunk] = self.chunk(k)[flat[in_chunk] - k * self.chunk_elements]
+        return values
+
+    def dense(self):
+        """
+        :return: the whole view decompressed into a numpy array
+        """
+        return self.read(0, self.size).reshape(self.shape)
+
+    def __array__(self, dtype=None, copy=None):
+        values = self.dense()
+        return values if dtype is None else values.astype(dtype)
+
+
+def load_compressed(path, cache_chunks=64):
+    """
+    :param path: file written by save_compressed
+    :param cache_chunks: number of decompressed chunks kept in memory
+    :return: CompressedPayoffs
+    """
+    return CompressedPayoffs(path, cache_chunks)
@@ -0,0 +1,128 @@
+# distances between voters and candidate positions
+
+import numpy as np
+import itertools
+
+
+def grid_coordinates(num_positions, dimensions=1):
+    """
+    coordinates of every position on the political hypercube,
+    ordered as in itertools.product(range(num_positions), repeat=dimensions)
+    :param num_positions: number of positions along each dimension
+    :param dimensions: number of dimensions
+    :return: integer array of shape (num_positions**dimensions, dimensions)
+    """
+    return np.array(list(itertools.product(range(num_positions), repeat=dimensions))).reshape(-1, dimensions)
+
+
+def l1_distance(differences):
+    return np.abs(differences).sum(axis=-1)
+
+
+def linf_distance(differences):
+    return np.abs(differences).max(axis=-1)
+
+
+def squared_euclidean_distance(differences):
+    # squared distances keep the order of euclidean distances while staying exact integers
+    return (differences**2).sum(axis=-1)
+
+
+METRICS = {
+    "l1": l1_distance,
+    "linf": linf_distance,
+    "euclidean": squared_euclidean_distance,
+}
+
+
+# metrics that are a sum over axes of a function of the coordinate difference along that axis
+SEPARABLE_METRICS = {
+    "l1": np.abs,
+    "euclidean": np.square,
+}
+
+
+def smallest_dtype(num_positions, dimensions, metric):
+    """
+    smallest integer type holding every distance of the metric on the grid (at least int16)
+    """
+    largest = METRICS[metric](np.full(dimensions, num_positions - 1))
+    return np.promote_types(np.int16, np.min_scalar_type(largest))
+
+
+class LazyDistances:
+    """
+    Distance matrix of a grid metric computed a row at a time, for grids too large to hold all V^2 distances.
+    Supports the same row indexing and iteration as the precomputed matrix.
+    """
+
+    def __init__(self, num_positions, dimensions=1, metric="l1"):
+        """
+        :param num_positions: number of positions along each dimension
+        :param dimensions: number of dimensions
+        :param metric: name of a metric in METRICS
+        """
+        self.coords = grid_coordinates(num_positions, dimensions)
+        self.metric = METRICS[metric]
+        self.dtype = smallest_dtype(num_positions, dimensions, metric)
+        self.shape = (len(self.coords), len(self.coords))
+
+    def __len__(self):
+        return len(self.coords)
+
+    def __getitem__(self, space):
+        return self.metric(self.coords - self.coords[space]).astype(self.dtype)
+
+    def __iter__(self):
+        for space in range(len(self.coords)):
+            yield self[space]
+
+
+def grid_distances(num_positions, dimensions=1, metric="l1", lazy=False):
+    """
+    distance between every pair of positions on the political hypercube
+    :param num_positions: number of positions along each dimension
+    :param dimensions: number of dimensions
+    :param metric: "l1" (shortest path on the grid), "linf" or "euclidean" (stored squared)
+    :param lazy: if True, rows are computed when accessed rather than stored
+    :return: integer array of shape (num_positions**dimensions, num_positions**dimensions), or LazyDistances
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric {metric}, expected one of {list(METRICS)}.")
+    if lazy:
+        return LazyDistances(num_positions, dimensions, metric)
+    coords = grid_coordinates(num_positions, dimensions)
+    dtype = smallest_dtype(num_positions, dimensions, metric)
+    distance_matrix = np.empty((len(coords), len(coords)), dtype=dtype)
+    for space, coord in enumerate(coords):  # row by row to avoid a V^2 * dimensions intermediate
+        distance_matrix[space] = METRICS[metric](coords - coord)
+    return distance_matrix
+
+
+def graph_distances(graph, nodes=None):
+    """
+    shortest path distances on an arbitrary graph, for topologies that are not grids
+    :param graph: networkx graph
+    :param nodes: ordering of the nodes, defaults to list(graph.nodes)
+    :return: integer array of shape (len(nodes), len(nodes))
+    """
+    import networkx as nx  # only needed for non-grid topologies
+
+    nodes = list(graph.nodes) if nodes is None else list(nodes)
+    node_index = {node: i for i, node in enumerate(nodes)}
+    distance_matrix = np.full((len(nodes), len(nodes)), np.iinfo(np.int32).max, dtype=np.int32)
+    for source, lengths in nx.all_pairs_shortest_path_length(graph):
+        row = distance_matrix[node_index[source]]
+        for target, length in lengths.items():
+            row[node_index[target]] = length
+    return distance_matrix
+
+
+def get_distances(num_positions, dimensions=1, metric="l1"):
+    """
+    resolves a metric argument into a distance matrix
+    :param metric: name of a grid metric, or a precomputed (spaces, positions) distance matrix
+    """
+    if isinstance(metric, str):
+        return grid_distances(num_positions, dimensions, metric)
+    return metric
@@ -1,11 +1,14 @@
 import numpy as np
+import os
 import nD_equilibria_finder as nD
 donald_trump = [(18, 18)]
 joe_biden = [(16, 17)]
-payoffs = np.load("gt_cw1\payoffs_20_2_2.npy")
+payoffs = np.load(os.path.join(os.path.dirname(os.path.abspath(__file__)), "payoffs_20_2_2.npy"), mmap_mode="r")
+# best responses are computed once, after which each query is a lookup
+best_responses = nD.BestResponseIndex(payoffs, 20, 2)
 
-joe_biden_best_response = nD.find_best_responses(donald_trump, payoffs, 20, 2)
+joe_biden_best_response = best_responses.best_responses(donald_trump)
 print(joe_biden_best_response)
 
-donald_trump_best_response = nD.find_best_responses(joe_biden, payoffs, 20, 2)
+donald_trump_best_response = best_responses.best_responses(joe_biden)
 print(donald_trump_best_response)
\ No newline at end of file
@@ -0,0 +1,182 @@
+# progress, timing and profiling of long runs
+
+import cProfile
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource  # not available on windows
+except ImportError:
+    resource = None
+
+
+def peak_memory():
+    """
+    :return: high-water mark of the resident memory of this process in bytes, or None where unavailable
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # kilobytes everywhere but macOS
+
+
+def print_progress(report):
+    """
+    callback printing a progress report as a single line
+    :param report: dict passed to the callbacks of RunMetrics.progress
+    """
+    line = f"{report['task']}: {report['done']}"
+    if report["total"]:
+        line += f"/{report['total']} ({100 * report['done'] / report['total']:.1f}%)"
+    line += f", {report['rate']:.4g}/s"
+    if report["eta"] is not None:
+        line += f", ETA {report['eta']:.1f}s"
+    if report["peak_memory"] is not None:
+        line += f", peak memory {report['peak_memory'] / 2**20:.1f}MiB"
+    print(line, flush=True)
+
+
+class RunMetrics:
+    """
+    Collects the progress, phase timings and counters of a run, passing progress reports to callbacks.
+    Used as a context manager, or with close called at the end, it writes the profiles of the run.
+    Functions taking a metrics argument (payoff_finder, find_equilibria, parallel_payoff_finder,
+    StreamingEquilibriumFinder, MixedEquilibriumFinder.find_equilibrium) report to it.
+    """
+
+    def __init__(self, callbacks=(print_progress,), interval=1.0, profile_dir=None):
+        """
+        :param callbacks: functions called with a dict report as a task progresses
+        :param interval: least number of seconds between reports of a task, except its last
+        :param profile_dir: if given, each phase runs under cProfile and its stats are written
+        to <profile_dir>/<phase>.prof when the run is closed, for reading with pstats
+        """
+        self.callbacks = list(callbacks)
+        self.interval = interval
+        self.profile_dir = profile_dir
+        # seconds spent in each phase, e.g. building payoffs or checking best responses
+        self.phase_times = {}
+        self.counters = {}
+        self.tasks = {}
+        self.peak_memory = peak_memory()
+        self._profilers = {}
+        self._profiling = False
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    @contextmanager
+    def phase(self, name):
+        """
+        context manager adding the time spent inside it to the phase
+        :param name: name of the phase
+        """
+        profiler = None
+        if self.profile_dir and not self._profiling:  # only one profiler can run at a time
+            profiler = self._profilers.setdefault(name, cProfile.Profile())
+            self._profiling = True
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.phase_times[name] = self.phase_times.get(name, 0) + time.perf_counter() - start
+            if profiler:
+                profiler.disable()
+                self._profiling = False
+            self.peak_memory = peak_memory()
+
+    def dump_profiles(self):
+        """
+        writes the cProfile stats collected so far for each phase to <profile_dir>/<phase>.prof
+        """
+        for name, profiler in self._profilers.items():
+            profiler.dump_stats(os.path.join(self.profile_dir, f"{name}.prof"))
+
+    def close(self):
+        """
+        ends the run, writing the profiles once rather than after each of the many entries of a phase
+        """
+        if self.profile_dir:
+            self.dump_profiles()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def count(self, name, n=1):
+        """
+        adds n to a counter, e.g. "payoff_cache.hits"
+        """
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def hit_rate(self, name):
+        """
+        :param name: name of a cache counted with "<name>.hits" and "<name>.misses"
+        :return: fraction of lookups that were hits, or None if there were none
+        """
+        hits = self.counters.get(f"{name}.hits", 0)
+        lookups = hits + self.counters.get(f"{name}.misses", 0)
+        return hits / lookups if lookups else None
+
+    def progress(self, task, done, total=None):
+        """
+        records that done units of a task are finished, reporting to the callbacks at most
+        once per interval and always when the task completes. A call with done=0 starts the task,
+        the rate is measured from it
+        :param task: name of the task, e.g. "payoffs"
+        :param done: units of the task finished so far
+        :param total: units in the whole task, if known
+        """
+        now = time.perf_counter()
+        if done == 0 or task not in self.tasks:
+            self.tasks[task] = {"start": now, "reported": now}
+        state = self.tasks[task]
+        state.update(done=done, total=total, elapsed=now - state["start"])
+        finished = total is not None and done >= total
+        if not finished and now - state["reported"] < self.interval:
+            return
+        state["reported"] = now
+        self.peak_memory = peak_memory()
+        report = self.report(task)
+        for callback in self.callbacks:
+            callback(report)
+
+    def report(self, task):
+        """
+        :param task: name of a task progress was recorded for
+        :return: dict of the task's progress, rate in units per second and ETA in seconds,
+        with the peak memory, phase times and counters so far
+        """
+        state = self.tasks[task]
+        rate = state["done"] / state["elapsed"] if state["elapsed"] > 0 else 0.0
+        eta = None
+        if state["total"] is not None and rate > 0:
+            eta = (state["total"] - state["done"]) / rate
+        return {
+            "task": task,
+            "done": state["done"],
+            "total": state["total"],
+            "elapsed": state["elapsed"],
+            "rate": rate,
+            "eta": eta,
+            "peak_memory": self.peak_memory,
+            "phase_times": dict(self.phase_times),
+            "counters": dict(self.counters),
+        }
+
+    def summary(self):
+        """
+        :return: dict of the phase times, counters, cache hit rates, peak memory and final rate of each task
+        """
+        caches = {name.rsplit(".", 1)[0] for name in self.counters if name.endswith((".hits", ".misses"))}
+        return {
+            "phase_times": dict(self.phase_times),
+            "counters": dict(self.counters),
+            "hit_rates": {name: self.hit_rate(name) for name in sorted(caches)},
+            "peak_memory": peak_memory(),
+            "rates": {task: self.report(task)["rate"] for task in self.tasks},
+        }
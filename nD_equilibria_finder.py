@@ -1,53 +1,343 @@
 # political compass payoff optimiser
 
-import networkx as nx
 import numpy as np
-import itertools
-import copy
+import distance_metrics
+import payoff_cache
 
 
-def payoff_finder(num_positions, dimensions=1, num_players=2):
+# how a space is split between equidistant players, and the version of the payoff code,
+# both part of the key of cached payoff tensors (bump PAYOFF_VERSION when payoffs change)
+TIE_RULE = "split"
+PAYOFF_VERSION = 3
+# number of (profile, player) entries handled per batch by profile_payoffs
+BATCH_ELEMENTS = 2**15
+# number of (space, profile, player) distances profile_payoffs compares at once
+SPACE_BLOCK_ELEMENTS = 2**22
+
+
+def profile_payoffs(profiles, distance_matrix, square_weight, player=None):
+    """
+    computes the payoffs of the players for a batch of profiles at once
+    each space is split evenly between the closest occupied positions,
+    and the share of a position is split evenly between the players on it
+    :param profiles: integer array of shape (batch, num_players) giving position indices
+    :param distance_matrix: array of shape (spaces, positions), distance from each space to each position
+    :param square_weight: weight of a single space, or array of the weight of each space
+    :param player: if given, only the payoff of this player is computed, e.g. -1 for the last player
+    :return: array of shape (batch, num_players) of payoffs, or (batch,) for a single player
+    """
+    profiles = np.asarray(profiles)
+    # smallest type holding the number of closest positions times the players on one
+    count_type = np.min_scalar_type(profiles.shape[1]**2)
+    same_spot = profiles[:, :, None] == profiles[:, None, :]  # (batch, players, players)
+    # a player only counts towards the occupied positions if no earlier player shares its spot
+    first_on_spot = ~np.tril(same_spot, -1).any(axis=2).T
+    # players are kept on the middle axis, so reductions over them run along contiguous batches
+    player_overlap = same_spot.sum(axis=2, dtype=count_type).T
+    if player is not None:
+        player_overlap = player_overlap[player]
+
+    payoffs = np.zeros(player_overlap.shape)
+    weights = np.broadcast_to(square_weight, (len(distance_matrix),))
+    spaces = np.flatnonzero(weights)  # zero weights, e.g. spaces masked out of the electorate, add nothing
+    block = max(1, SPACE_BLOCK_ELEMENTS // profiles.size)
+    for start in range(0, len(spaces), block):
+        block_spaces = spaces[start:start + block]
+        if isinstance(distance_matrix, np.ndarray):
+            rows = distance_matrix[block_spaces]
+        else:  # LazyDistances or a list of rows
+            rows = np.stack([distance_matrix[space] for space in block_spaces])
+        distances = rows[:, profiles.T]  # (spaces, players, batch)
+        closest = distances == distances.min(axis=1, keepdims=True)
+        closest_unique = (closest & first_on_spot).sum(axis=1, dtype=count_type)
+        if player is None:
+            shares = weights[block_spaces, None, None] / (closest_unique[:, None, :] * player_overlap)
+            shares *= closest
+        else:
+            shares = weights[block_spaces, None] / (closest_unique * player_overlap)
+            shares *= closest[:, player]
+        for space_shares in shares:  # spaces added in order, as in the loop version
+            payoffs += space_shares
+    return payoffs if player is not None else payoffs.T
+
+
+def payoff_finder(num_positions, dimensions=1, num_players=2, metric="l1", cache=None, metrics=None, weights=None):
     """
     :param num_positions: number of positions along each
     :param dimensions: number of dimensions
     :param num_players: number of players
-    :return:
+    :param metric: name of a grid metric in distance_metrics.METRICS, or a precomputed distance matrix
+    (e.g. from distance_metrics.graph_distances, with num_positions the number of nodes and dimensions=1)
+    :param cache: PayoffCache checked before computing, defaults to payoff_cache.default_cache(),
+    set up by the PAYOFF_CACHE_DIR and PAYOFF_CACHE_MAX_BYTES environment variables; False to never use a cache
+    :param metrics: instrumentation.RunMetrics receiving the "payoffs" phase time, progress and cache hits
+    :param weights: voters on each space, see space_weights; by default every space has weight
+    1/num_positions**dimensions so payoffs are vote shares
+    :return: payoff tensor, entry [i_1, ..., i_n] is the payoff of the player on i_n. Whenever a cache is used
+    (including through PAYOFF_CACHE_DIR) this is a read-only memory map, else a writable array, so copy it
+    before changing it in place, e.g. with update_payoffs
+    """
+    if cache is None:
+        cache = payoff_cache.default_cache()
+    if metrics is None:
+        return get_payoffs(num_positions, dimensions, num_players, metric, cache, weights=weights)
+    with metrics.phase("payoffs"):
+        return get_payoffs(num_positions, dimensions, num_players, metric, cache, metrics, weights)
+
+
+def get_payoffs(num_positions, dimensions, num_players, metric, cache, metrics=None, weights=None):
+    """
+    looks up the payoff tensor in the cache, computing and storing it if missing
+    """
+    # precomputed distance matrices and weighted electorates are not cached
+    if not cache or not isinstance(metric, str) or weights is not None:
+        return compute_payoffs(num_positions, dimensions, num_players, metric, metrics, weights)
+
+    computed = []
+
+    def compute():
+        computed.append(True)
+        return compute_payoffs(num_positions, dimensions, num_players, metric, metrics)
+
+    key = (num_positions, dimensions, num_players, metric, TIE_RULE, PAYOFF_VERSION)
+    payoff_tensor = cache.get_or_compute(compute, *key)
+    if metrics:
+        metrics.count("payoff_cache.misses" if computed else "payoff_cache.hits")
+    return payoff_tensor
+
+
+def compute_payoffs(num_positions, dimensions, num_players, metric, metrics=None, weights=None):
+    """
+    computes the payoff tensor returned by payoff_finder, without looking in the cache
     """
-    square_weight = 1/(num_positions**dimensions)
-    # grid object describing positions on political hypercube
-    G = nx.grid_graph([num_positions for _ in range(dimensions)])
-    distance_dict = dict(nx.all_pairs_shortest_path_length(G))
-    position_list = list(itertools.product(list(range(num_positions)), repeat=dimensions))
-    position_dict = {}
-    for i, pos in enumerate(position_list):  # code for accessing positions
-        position_dict[pos] = i
-
-    payoff_tensor = np.zeros((num_positions**dimensions,) * num_players)
-    # loop over positions of n-1 players, computing payoff for final player
-    # this gives entire list as game is symmetric
-    for play in itertools.product(position_list, repeat=num_players-1):
-        indices = [position_dict[x] for x in play]
-        for player_spot in position_list:  # for each playable position by nth player
-            pos = copy.deepcopy(list(play))  # list of all positions
-            pos.append(player_spot)
-            # number of players on player_spot
-            player_overlap = sum([int(b == player_spot) for b in pos])
-            for space in position_list:  # for each space in grid
-                distances = distance_dict[space]  # distances to each position from space
-                player_distances = [distances[loc] for loc in pos]  # the distance of each player from space
-                minimum = min(player_distances)
-                if distances[player_spot] > minimum:  # if player is not closest to space
-                    continue
-                else:  # player is closest, compute and give payoff
-                    # finding number of occupied positions which are equidistant
-                    pos_closest = [b for b in pos if distances[b] == minimum]
-                    closest_unique = len(list(set(pos_closest)))
-                    indices_set = [[k] for k in indices]
-                    indices_set.append([position_dict[player_spot]])
-                    payoff_tensor[tuple(indices_set)] += square_weight/(max(1, closest_unique) * max(1, player_overlap))
+    num_spots = num_positions**dimensions
+    if num_players == 2 and isinstance(metric, str) and weights is None:
+        if metrics:  # computed in one go, so progress is only known at the end
+            metrics.progress("payoffs", 0, num_spots**2)
+        payoff_tensor = election_payoffs(num_positions, dimensions, metric, ordered=True)[1]
+        if metrics:
+            metrics.progress("payoffs", payoff_tensor.size, payoff_tensor.size)
+        return payoff_tensor
+    if weights is None:
+        square_weight = 1/(num_positions**dimensions)
+    else:
+        square_weight = space_weights(num_positions, dimensions, weights)
+    distance_matrix = distance_metrics.get_distances(num_positions, dimensions, metric)
+
+    payoff_tensor = np.zeros((num_spots,) * num_players)
+    fill_payoffs(payoff_tensor, 0, payoff_tensor.size, distance_matrix, square_weight, metrics)
     return payoff_tensor
 
 
+def fill_payoffs(payoff_tensor, start, stop, distance_matrix, square_weight, metrics=None):
+    """
+    fills a range of the flattened payoff tensor in place, batch by batch
+    :param payoff_tensor: C-contiguous tensor (array or memory map) of shape (num_spots,)*num_players
+    :param start: first flat index to fill
+    :param stop: flat index to stop before
+    :param distance_matrix: array of shape (spaces, positions)
+    :param square_weight: weight of a single space, or array of the weight of each space
+    :param metrics: instrumentation.RunMetrics receiving the number of profiles filled as "payoffs" progress
+    """
+    flat_payoffs = payoff_tensor.reshape(-1)
+    # game is symmetric, so the payoff of the final player gives the entire tensor
+    batch_size = max(1, BATCH_ELEMENTS // payoff_tensor.ndim)
+    if metrics:
+        metrics.progress("payoffs", 0, stop - start)
+    for batch_start in range(start, stop, batch_size):
+        batch_stop = min(batch_start + batch_size, stop)
+        profiles = np.stack(np.unravel_index(np.arange(batch_start, batch_stop), payoff_tensor.shape), axis=1)
+        flat_payoffs[batch_start:batch_stop] = profile_payoffs(profiles, distance_matrix, square_weight, -1)
+        if metrics:
+            metrics.progress("payoffs", batch_stop - start, stop - start)
+
+
+def space_weights(num_positions, dimensions, weights):
+    """
+    checks and flattens the weights of the voters on each space, e.g. a real electorate loaded with np.load
+    :param num_positions: number of positions along each dimension
+    :param dimensions: number of dimensions
+    :param weights: array of shape (num_positions,)*dimensions or (num_positions**dimensions,);
+    weights summing to one give payoffs as vote shares, zero weights mask spaces out
+    :return: float array of shape (num_positions**dimensions,)
+    """
+    weights = np.asarray(weights, dtype=float)
+    if weights.size != num_positions**dimensions:
+        raise ValueError(f"Expected {num_positions**dimensions} weights, one per space, got {weights.size}.")
+    if np.any(weights < 0):
+        raise ValueError("Weights must be non-negative.")
+    return weights.reshape(-1)
+
+
+def update_payoffs(payoff_tensor, distance_matrix, spaces, weight_changes, metrics=None):
+    """
+    updates a payoff tensor in place after the weights of a few spaces change.
+    Each space adds to the payoffs independently of the others, so only the changed spaces are
+    visited, costing len(spaces)/num_spots of a full fill_payoffs
+    :param payoff_tensor: writable tensor of shape (num_spots,)*num_players, as from payoff_finder
+    (cached tensors are read-only, copy them first)
+    :param distance_matrix: array of shape (spaces, positions) the tensor was computed with
+    :param spaces: flat indices of the spaces whose weights change
+    :param weight_changes: new weight minus old weight of each space in spaces
+    :param metrics: instrumentation.RunMetrics receiving the number of profiles updated as "updates" progress
+    """
+    spaces = np.asarray(spaces, dtype=np.intp).reshape(-1)
+    if len(spaces) == 0:
+        return
+    changed_distances = [distance_matrix[space] for space in spaces]  # rows also work for LazyDistances
+    weight_changes = np.broadcast_to(np.asarray(weight_changes, dtype=float), spaces.shape)
+    flat_payoffs = payoff_tensor.reshape(-1)
+    batch_size = max(1, BATCH_ELEMENTS // payoff_tensor.ndim)
+    if metrics:
+        metrics.progress("updates", 0, flat_payoffs.size)
+    for batch_start in range(0, flat_payoffs.size, batch_size):
+        batch_stop = min(batch_start + batch_size, flat_payoffs.size)
+        profiles = np.stack(np.unravel_index(np.arange(batch_start, batch_stop), payoff_tensor.shape), axis=1)
+        flat_payoffs[batch_start:batch_stop] += profile_payoffs(profiles, changed_distances, weight_changes, -1)
+        if metrics:
+            metrics.progress("updates", batch_stop, flat_payoffs.size)
+
+
+def election_payoffs(num_positions, dimensions=1, metric="l1", ordered=False):
+    """
+    payoffs of both players in the two player election game, shared by payoff_finder and PayoffPlotter
+    :param num_positions: number of positions along each dimension
+    :param dimensions: number of dimensions
+    :param metric: name of a grid metric in distance_metrics.METRICS
+    :param ordered: if True, add up each space's share in turn as fill_payoffs does, giving payoff_finder's
+    tensor bit for bit at O(V^3) cost in more than one dimension; otherwise count the spaces each player
+    wins, which can differ from it in the last bits
+    :return: (payoffs_0, payoffs_1), arrays of shape (V, V) where entry [i, j] is the payoff of
+    player 0 on position i, respectively player 1 on position j
+    """
+    n = num_positions
+    num_spots = n**dimensions
+    if ordered:
+        payoffs_1 = ordered_election_payoffs(num_positions, dimensions, metric)
+        return payoffs_1.T, payoffs_1
+    if dimensions == 1:
+        # every metric orders a line the same way: for i < j, the spaces up to (i + j) / 2
+        # go to i, with a tie on the midpoint when it is a space, giving i (i + j + 1) / 2 spaces
+        i, j = np.arange(n)[:, None], np.arange(n)[None, :]
+        spaces_0 = np.where(i < j, (i + j + 1) / 2, np.where(i > j, n - (i + j + 1) / 2, n / 2))
+        payoffs_0 = spaces_0 / n
+        return payoffs_0, 1 - payoffs_0
+    if metric == "linf":
+        closer = linf_closer_counts(n, dimensions)
+    elif metric in distance_metrics.SEPARABLE_METRICS:
+        closer = separable_closer_counts(n, dimensions, distance_metrics.SEPARABLE_METRICS[metric])
+    else:
+        payoff_tensor = np.zeros((num_spots, num_spots))
+        fill_payoffs(payoff_tensor, 0, payoff_tensor.size,
+                     distance_metrics.get_distances(num_positions, dimensions, metric), 1/num_spots)
+        return payoff_tensor.T, payoff_tensor
+
+    # rows and columns are indexed by (i_1, j_1, ..., i_d, j_d), reorder to (i_1..i_d, j_1..j_d)
+    order = list(range(0, 2 * dimensions, 2)) + list(range(1, 2 * dimensions, 2))
+    closer = closer.reshape((n, n) * dimensions).transpose(order).reshape(num_spots, num_spots)
+    # every space is closer to one of the two or tied, and closer.T counts those closer to player 1
+    ties = num_spots - closer - closer.T
+    payoffs_0 = (closer + ties / 2) / num_spots
+    return payoffs_0, 1 - payoffs_0
+
+
+def ordered_election_payoffs(num_positions, dimensions=1, metric="l1"):
+    """
+    payoffs of player 1 in the two player election game exactly as fill_payoffs computes them,
+    adding the shares of the spaces one at a time in order
+    :return: array of shape (V, V) where entry [i, j] is the payoff of player 1 on position j
+    against player 0 on position i
+    """
+    n = num_positions
+    num_spots = n**dimensions
+    weight = 1/num_spots
+    if dimensions == 1:
+        # for i < j player 1 wins the spaces past the midpoint, after half the midpoint when it is a space,
+        # and for i > j the spaces before the midpoint, then half of it; sums of k shares are tabulated
+        i, j = np.arange(n)[:, None], np.arange(n)[None, :]
+        tie = (i + j) % 2 == 0
+        won = np.where(i < j, n - 1 - (i + j) // 2, (i + j + 1) // 2)
+        wins = np.cumsum(np.concatenate([[0], np.full(n, weight)]))
+        tie_then_wins = np.cumsum(np.concatenate([[weight / 2], np.full(n, weight)]))
+        payoffs = np.where(i < j, np.where(tie, tie_then_wins[won], wins[won]),
+                           np.where(tie, wins[won] + weight / 2, wins[won]))
+        # a shared position ties on every space
+        np.fill_diagonal(payoffs, np.cumsum(np.full(n, weight / 2))[-1])
+        return payoffs
+
+    payoffs = np.zeros((num_spots, num_spots))
+    closer = np.empty(payoffs.shape, dtype=bool)
+    tied = np.empty(payoffs.shape, dtype=bool)
+    for distances in distance_metrics.get_distances(num_positions, dimensions, metric):
+        np.less(distances[None, :], distances[:, None], out=closer)
+        np.equal(distances[None, :], distances[:, None], out=tied)
+        np.add(payoffs, weight, out=payoffs, where=closer)
+        np.add(payoffs, weight / 2, out=payoffs, where=tied)
+    return payoffs
+
+
+def separable_closer_counts(n, dimensions, distance):
+    """
+    number of spaces closer to player 0 than to player 1 for a metric summing distance over the axes
+    :param n: number of positions along each dimension
+    :param dimensions: number of dimensions, at least two
+    :param distance: function of the coordinate differences along one axis, e.g. np.abs
+    :return: array of shape (n^2 (dimensions - 1), n^2) with rows and columns indexed by the pairs
+    (i_k, j_k) of player positions along the axes, all but the last, then the last
+    """
+    # along one axis, the coordinate x adds term[i, j, x] to d(x, i) - d(x, j)
+    axis = np.arange(n)
+    term = distance(axis[None, None, :] - axis[:, None, None]) - distance(axis[None, None, :] - axis[None, :, None])
+    low = term.min()
+    width = term.max() - low + 1
+    # histogram[(i, j), v] counts the coordinates adding low + v
+    histogram = np.zeros((n * n, width))
+    np.add.at(histogram, (np.repeat(np.arange(n * n), n), (term - low).reshape(-1)), 1)
+
+    # distribution of the difference summed over all axes but the last, one row per combination
+    # of (i, j) along those axes; values start at partial_low
+    partial, partial_low = histogram, low
+    for _ in range(dimensions - 2):
+        combined = np.zeros((len(partial), n * n, partial.shape[1] + width - 1))
+        for v in range(width):  # convolving each partial distribution with each axis histogram
+            combined[:, :, v:v + partial.shape[1]] += partial[:, None, :] * histogram[None, :, v, None]
+        partial, partial_low = combined.reshape(-1, combined.shape[2]), partial_low + low
+
+    # the last axis only needs how many coordinates bring the total below zero
+    used = np.flatnonzero(partial.any(axis=0))  # squared distances leave most values unreachable
+    partial, totals = partial[:, used], partial_low + used
+    cumulative = np.concatenate([np.zeros((n * n, 1)), np.cumsum(histogram, axis=1)], axis=1)
+    below = cumulative[:, np.clip(-totals - low, 0, width)]  # last axis term < -total
+    # mirroring the positions on every axis turns row r into row len - 1 - r with the same counts,
+    # so only the first half of the rows and columns are multiplied
+    rows = np.minimum(np.arange(len(partial)), len(partial) - 1 - np.arange(len(partial)))
+    columns = np.minimum(np.arange(n * n), n * n - 1 - np.arange(n * n))
+    # counts stay below 2^24, so single precision sums them exactly and twice as fast
+    closer = partial[:rows.max() + 1].astype(np.float32) @ below[:columns.max() + 1].T.astype(np.float32)
+    return closer[np.ix_(rows, columns)].astype(float)
+
+
+def linf_closer_counts(n, dimensions):
+    """
+    number of spaces closer to player 0 than to player 1 for the linf metric, as separable_closer_counts
+    """
+    # within[i, a, x] is True when the coordinate x is at most a from i, so that
+    # inside[(i, j), a, b] counts the coordinates within a of i and within b of j
+    axis = np.arange(n)
+    within = (np.abs(axis[None, None, :] - axis[:, None, None]) <= axis[None, :, None]).astype(float)
+    inside = (within.reshape(n * n, n) @ within.reshape(n * n, n).T).reshape(n, n, n, n).transpose(0, 2, 1, 3)
+    inside = inside.reshape(n * n, n, n)
+    # a space is closer to i when, for some b >= 1, it is within b - 1 of i and within b of j
+    # but not within b - 1 of j; each term is a product over the axes
+    b = np.arange(1, n)
+    lower, equal = inside[:, b - 1, b], inside[:, b - 1, b - 1]
+    rows_lower, rows_equal = np.ones((1, n - 1)), np.ones((1, n - 1))
+    for _ in range(dimensions - 1):
+        rows_lower = (rows_lower[:, None, :] * lower[None]).reshape(-1, n - 1)
+        rows_equal = (rows_equal[:, None, :] * equal[None]).reshape(-1, n - 1)
+    return rows_lower @ lower.T - rows_equal @ equal.T
+
+
 def find_best_responses(player_positions, payoff_tensor, num_positions, dimensions):
     """
     accepts a list of players positions as tuples, as well as a payoff tensor
@@ -61,54 +351,115 @@ def find_best_responses(player_positions, payoff_tensor, num_positions, dimensio
     :param dimensions: number of dimensions
     :return: list of the best responses as tuples
     """
-    # form position dictionary
-    position_list = list(itertools.product(list(range(num_positions)), repeat=dimensions))
-    position_dict = {}
-    for i, pos in enumerate(position_list):  # code for accessing positions
-        position_dict[pos] = i
-
-    payoffs = copy.deepcopy(payoff_tensor)
+    grid_shape = (num_positions,) * dimensions
+    payoffs = payoff_tensor  # indexing gives views, so the tensor is never copied
     for i in player_positions:
-        payoffs = payoffs[position_dict[i]]
+        payoffs = payoffs[np.ravel_multi_index(i, grid_shape)]
 
     max_payoff = np.max(payoffs)
-    best_response_keys = np.argwhere(np.isclose(payoffs, max_payoff, 1e-12))
-    best_response = []
-    for k in best_response_keys:
-        best_response.append(position_list[k[0]])
+    best_response_keys = np.flatnonzero(np.isclose(payoffs, max_payoff, 1e-12))
+    return [tuple(int(x) for x in np.unravel_index(k, grid_shape)) for k in best_response_keys]
+
+
+class BestResponseIndex:
+    """
+    Best responses against every profile of the other players, computed once from a payoff tensor
+    so that best response queries and equilibrium checks become lookups.
+    """
+
+    def __init__(self, payoff_tensor, num_positions, dimensions, rtol=1e-12):
+        """
+        :param payoff_tensor: payoff tensor as returned by payoff_finder
+        :param num_positions: number of positions along each dimension
+        :param dimensions: number of dimensions
+        :param rtol: relative tolerance when comparing payoffs with the maximum, as in find_best_responses
+        """
+        self.payoff_tensor = payoff_tensor
+        self.num_players = payoff_tensor.ndim
+        self.grid_shape = (num_positions,) * dimensions
+        # best payoff available to the last player against each profile of the others
+        self.max_payoffs = payoff_tensor.max(axis=-1)
+        self.is_best_response = np.isclose(payoff_tensor, self.max_payoffs[..., None], rtol)
+
+    def index(self, position):
+        """
+        :param position: position on the grid as a tuple
+        :return: index of the position along each axis of the payoff tensor
+        """
+        return int(np.ravel_multi_index(position, self.grid_shape))
+
+    def position(self, index):
+        """
+        :param index: index along an axis of the payoff tensor
+        :return: position on the grid as a tuple
+        """
+        return tuple(int(x) for x in np.unravel_index(index, self.grid_shape))
+
+    def best_responses(self, player_positions):
+        """
+        :param player_positions: positions of all players but one, as tuples
+        :return: list of the best responses as tuples, as in find_best_responses
+        """
+        indices = tuple(self.index(pos) for pos in player_positions)
+        return [self.position(k) for k in np.flatnonzero(self.is_best_response[indices])]
+
+    def best_payoff(self, player_positions):
+        """
+        :param player_positions: positions of all players but one, as tuples
+        :return: payoff of a best response
+        """
+        return self.max_payoffs[tuple(self.index(pos) for pos in player_positions)]
+
+    def is_equilibrium(self, profile):
+        """
+        :param profile: position of every player, as tuples
+        :return: True if every player is playing a best response
+        """
+        indices = [self.index(pos) for pos in profile]
+        for i in range(self.num_players):
+            others = indices[:i] + indices[i + 1:]
+            if not self.is_best_response[tuple(others) + (indices[i],)]:
+                return False
+        return True
+
+    def equilibrium_mask(self):
+        """
+        :return: boolean tensor over all profiles, True where the profile is an equilibrium
+        """
+        # player i plays a best response where the tensor with the last axis moved to i is True
+        mask = self.is_best_response.copy()
+        for i in range(self.num_players - 1):
+            mask &= np.moveaxis(self.is_best_response, -1, i)
+        return mask
 
-    return best_response
+    def equilibria(self):
+        """
+        :return: list of all equilibria, each a tuple of positions, in the order of find_equilibria
+        """
+        return [tuple(self.position(k) for k in profile) for profile in np.argwhere(self.equilibrium_mask())]
 
 
-def find_equilibria(num_positions, dimensions, num_players, payoff_tensor=None, debug=False):
+def find_equilibria(num_positions, dimensions, num_players, payoff_tensor=None, debug=False, metrics=None):
     """
-    loops over possible positions, checks whether each is an equilibrium
+    checks every possible arrangement of positions at once using a BestResponseIndex
     returns all equilibria found
     :param num_positions: number of positions
     :param dimensions: number of dimensions
     :param num_players: number of players
     :param payoff_tensor: payoff tensor given payoffs for each possible set of plays
     :param debug:
+    :param metrics: instrumentation.RunMetrics, timing the "payoffs" and "best_responses" phases
     :return:
     """
     if payoff_tensor is None:  # computing payoffs if none given (costly for all but small input)
         if debug:
             print("Computing payoff tensor...")
-        payoff_tensor = payoff_finder(num_positions, dimensions, num_players)
-
-    position_list = list(itertools.product(list(range(num_positions)), repeat=dimensions))
-    equilibria = []
-
-    for pos in itertools.product(position_list, repeat=num_players):  # for each possible arrangement
-        equilibrium_found = True
-        for i, spot in enumerate(pos):  # for each position, check it is a best response
-            other_plays = [pos[j] for j in range(num_players) if j != i]  # all other plays
-            if spot in find_best_responses(other_plays, payoff_tensor, num_positions, dimensions):
-                pass
-            else:
-                equilibrium_found = False
-                break
-        if equilibrium_found:
-            equilibria.append(pos)
+        payoff_tensor = payoff_finder(num_positions, dimensions, num_players, metrics=metrics)
 
+    if metrics is None:
+        return BestResponseIndex(payoff_tensor, num_positions, dimensions).equilibria()
+    metrics.progress("best_responses", 0, payoff_tensor.size)
+    with metrics.phase("best_responses"):
+        equilibria = BestResponseIndex(payoff_tensor, num_positions, dimensions).equilibria()
+    metrics.progress("best_responses", payoff_tensor.size, payoff_tensor.size)
     return equilibria
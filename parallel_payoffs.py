@@ -0,0 +1,77 @@
+# payoff tensor computed in parallel, sharded along the leading player axis
+
+import numpy as np
+import os
+import tempfile
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import nD_equilibria_finder as nD
+import distance_metrics
+
+
+def payoff_shard(path, num_positions, dimensions, metric, first, last):
+    """
+    worker task: computes the payoffs where the first player is on positions first to last - 1,
+    writing them straight into the memory-mapped output tensor
+    :param path: .npy file holding the output tensor
+    :param num_positions: number of positions along each dimension
+    :param dimensions: number of dimensions
+    :param metric: grid metric name or precomputed distance matrix, as in nD.payoff_finder
+    :param first: first index of the leading axis in the shard
+    :param last: index of the leading axis to stop before
+    """
+    payoff_tensor = np.load(path, mmap_mode="r+")
+    profiles_per_index = payoff_tensor.size // payoff_tensor.shape[0]
+    distance_matrix = distance_metrics.get_distances(num_positions, dimensions, metric)
+    nD.fill_payoffs(payoff_tensor, first * profiles_per_index, last * profiles_per_index,
+                    distance_matrix, 1/(num_positions**dimensions))
+    payoff_tensor.flush()
+
+
+def parallel_payoff_finder(num_positions, dimensions=1, num_players=2, metric="l1",
+                           output_path=None, workers=None, chunk_size=None, metrics=None):
+    """
+    computes the same tensor as nD.payoff_finder using a pool of processes.
+    Every profile is computed exactly as in the serial version, so the result is identical
+    whatever the number of workers or the chunk size.
+    :param num_positions: number of positions along each dimension
+    :param dimensions: number of dimensions
+    :param num_players: number of players
+    :param metric: grid metric name or precomputed distance matrix, as in nD.payoff_finder
+    :param output_path: .npy file the workers write into, if None a temporary file is used and removed
+    :param workers: number of processes, defaults to the number of CPUs
+    :param chunk_size: number of positions of the first player per task, defaults to about four tasks per worker
+    :param metrics: instrumentation.RunMetrics receiving the "payoffs" phase time and progress as shards finish
+    :return: payoff tensor, read-only memory-mapped from output_path if given, else in memory
+    """
+    workers = workers or os.cpu_count()
+    num_spots = num_positions**dimensions
+    chunk_size = chunk_size or max(1, -(-num_spots // (4 * workers)))
+
+    temporary = output_path is None
+    if temporary:
+        handle, output_path = tempfile.mkstemp(suffix=".npy")
+        os.close(handle)
+    try:
+        # allocated on disk once, each worker then maps it and fills its own shard
+        np.lib.format.open_memmap(output_path, mode="w+", shape=(num_spots,) * num_players).flush()
+        total = num_spots**num_players
+        phase = metrics.phase("payoffs") if metrics else nullcontext()
+        with phase, ProcessPoolExecutor(max_workers=workers) as executor:
+            shards = {executor.submit(payoff_shard, output_path, num_positions, dimensions, metric,
+                                      first, min(first + chunk_size, num_spots)): min(chunk_size, num_spots - first)
+                      for first in range(0, num_spots, chunk_size)}
+            done = 0
+            if metrics:
+                metrics.progress("payoffs", 0, total)
+            for shard in as_completed(shards):
+                shard.result()  # raises any error from the worker
+                done += shards[shard] * total // num_spots
+                if metrics:
+                    metrics.progress("payoffs", done, total)
+        if temporary:
+            return np.load(output_path)
+        return np.load(output_path, mmap_mode="r")
+    finally:
+        if temporary:
+            os.remove(output_path)
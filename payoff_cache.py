@@ -0,0 +1,139 @@
+# on-disk cache of payoff tensors, shared between runs and processes
+
+import numpy as np
+import os
+
+
+# setting this environment variable turns on caching for payoff_finder by default
+CACHE_DIR_VARIABLE = "PAYOFF_CACHE_DIR"
+# size in bytes above which that cache evicts the least recently used tensors, unlimited if unset
+CACHE_MAX_BYTES_VARIABLE = "PAYOFF_CACHE_MAX_BYTES"
+
+
+class PayoffCache:
+    """
+    Directory of payoff tensors saved as .npy files, keyed on the game and the code that built it.
+    Tensors are opened memory-mapped and read-only, so processes loading the same game share its pages.
+    """
+
+    def __init__(self, directory, max_bytes=None):
+        """
+        :param directory: directory holding the cached tensors, created if missing
+        :param max_bytes: total size of cached files above which the least recently used are removed
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, num_positions, dimensions, num_players, metric, tie_rule, version):
+        """
+        :return: path of the file holding the tensor for the given key
+        """
+        name = f"payoffs_{num_positions}_{dimensions}_{num_players}_{metric}_{tie_rule}_v{version}.npy"
+        return os.path.join(self.directory, name)
+
+    def load(self, *key):
+        """
+        :param key: arguments as for path
+        :return: read-only memory-mapped tensor, or None if the key is not cached
+        """
+        path = self.path(*key)
+        try:
+            payoff_tensor = np.load(path, mmap_mode="r")
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)  # modification time records the last use, for eviction
+        except OSError:  # e.g. a read-only shared cache, which is then evicted by age
+            pass
+        return payoff_tensor
+
+    def store(self, payoff_tensor, *key):
+        """
+        saves a tensor under the key, then evicts old files if the cache is over its size limit
+        :param payoff_tensor: tensor to save
+        :param key: arguments as for path
+        """
+        path = self.path(*key)
+        # written under a temporary name first so other processes never see a partial file
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as f:
+            np.save(f, payoff_tensor)
+        os.replace(temporary_path, path)
+        self.evict(keep=path)
+
+    def get_or_compute(self, compute, *key):
+        """
+        :param compute: function with no arguments computing the tensor when the key is not cached
+        :param key: arguments as for path
+        :return: the read-only memory-mapped tensor, computed and stored first if the key is not cached
+        """
+        payoff_tensor = self.load(*key)
+        if payoff_tensor is None:
+            payoff_tensor = compute()
+            self.store(payoff_tensor, *key)
+            # reopened so callers get the same read-only tensor whether or not it was cached
+            stored = self.load(*key)
+            if stored is not None:  # None only if another process evicted it already
+                payoff_tensor = stored
+        return payoff_tensor
+
+    def size(self):
+        """
+        :return: total size in bytes of the cached files
+        """
+        return sum(size for _, _, size in self._stats())
+
+    def evict(self, keep=None):
+        """
+        removes the least recently used files until the cache fits in max_bytes
+        :param keep: path that is never removed, e.g. the file just written
+        """
+        if self.max_bytes is None:
+            return
+        files = sorted(self._stats())
+        total = sum(size for _, _, size in files)
+        for _, path, size in files:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)  # processes with the file mapped keep their copy until they close it
+            except FileNotFoundError:  # already removed by another process
+                pass
+            except OSError:  # not ours to remove, e.g. a read-only shared cache
+                continue
+            total -= size
+
+    def _files(self):
+        return [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".npy")]
+
+    def _stats(self):
+        """
+        :return: list of (modification time, path, size) of the cached files, skipping any removed meanwhile
+        """
+        stats = []
+        for path in self._files():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            stats.append((stat.st_mtime, path, stat.st_size))
+        return stats
+
+
+def default_cache():
+    """
+    :return: PayoffCache in the directory named by the PAYOFF_CACHE_DIR environment variable, limited to
+    PAYOFF_CACHE_MAX_BYTES bytes if that is set, or None if PAYOFF_CACHE_DIR is unset
+    """
+    directory = os.environ.get(CACHE_DIR_VARIABLE)
+    if not directory:
+        return None
+    max_bytes = os.environ.get(CACHE_MAX_BYTES_VARIABLE)
+    try:
+        max_bytes = int(max_bytes) if max_bytes else None
+    except ValueError:
+        raise ValueError(f"{CACHE_MAX_BYTES_VARIABLE} must be a whole number of bytes, got {max_bytes!r}.")
+    return PayoffCache(directory, max_bytes)
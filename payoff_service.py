@@ -0,0 +1,415 @@
+# asyncio service answering best response, payoff and equilibrium queries over resident payoff tensors
+# run with: python payoff_service.py [--port 8765] [--data-dir .]
+# each request is a line of JSON, e.g.
+# {"id": 1, "op": "best_responses", "game": {"num_positions": 20, "dimensions": 2}, "others": [[[18, 18]]]}
+# answered by a line {"id": 1, "result": [[[16, 17], ...]]} or {"id": 1, "error": "..."}
+
+import numpy as np
+import argparse
+import asyncio
+import json
+import os
+import socket
+from collections import OrderedDict
+import nD_equilibria_finder as nD
+import payoff_cache
+
+
+DEFAULT_PORT = 8765
+# longest request line accepted, batched queries can be long
+LINE_LIMIT = 2**26
+# largest number of profiles of a game computed on request, 1 GiB of float64 payoffs
+MAX_PROFILES = 2**27
+
+
+def bounded_power(base, exponent, limit):
+    """
+    :param base: positive integer
+    :param exponent: positive integer
+    :param limit: largest power of interest
+    :return: base**exponent, or None if it is above limit, never forming numbers far larger than limit
+    """
+    if base > 1 and (base > limit or exponent > limit.bit_length()):  # base**exponent >= 2**exponent > limit
+        return None
+    power = base**exponent
+    return power if power <= limit else None
+
+
+class Game:
+    """
+    A payoff tensor kept resident with its best response index, answering queries on batches of profiles.
+    Queries are given position indices, one row per profile, so that many can be answered at once.
+    """
+
+    def __init__(self, payoff_tensor, num_positions, dimensions):
+        """
+        :param payoff_tensor: payoff tensor as from payoff_finder, e.g. memory-mapped from a cache
+        :param num_positions: number of positions along each dimension
+        :param dimensions: number of dimensions
+        """
+        self.payoff_tensor = payoff_tensor
+        self.index = nD.BestResponseIndex(payoff_tensor, num_positions, dimensions)
+        self.num_players = payoff_tensor.ndim
+        self.grid_shape = (num_positions,) * dimensions
+        self._equilibria = None
+
+    def indices(self, positions, num):
+        """
+        :param positions: nested list of shape (batch, num, dimensions) of grid positions
+        :param num: number of positions expected in each profile
+        :return: integer array of shape (batch, num) of position indices
+        """
+        positions = np.array(positions, dtype=np.intp)
+        if positions.size == 0:
+            return np.empty((0, num), dtype=np.intp)
+        if positions.ndim != 3 or positions.shape[1:] != (num, len(self.grid_shape)):
+            raise ValueError(f"Expected a list of profiles of {num} positions "
+                             f"with {len(self.grid_shape)} coordinates.")
+        if np.any(positions < 0) or np.any(positions >= self.grid_shape[0]):
+            raise ValueError(f"Positions must be on the grid of {self.grid_shape[0]} positions per dimension.")
+        return np.ravel_multi_index(tuple(np.moveaxis(positions, -1, 0)), self.grid_shape)
+
+    def best_responses(self, others):
+        """
+        :param others: integer array of shape (batch, num_players - 1), positions of all players but one
+        :return: list of the best responses to each row, as lists of positions
+        """
+        mask = self.index.is_best_response[tuple(others.T)]
+        return [[list(self.index.position(k)) for k in np.flatnonzero(row)] for row in mask]
+
+    def payoffs(self, profiles):
+        """
+        :param profiles: integer array of shape (batch, num_players), positions of every player
+        :return: list of the payoff of each player in each profile
+        """
+        values = np.empty(profiles.shape)
+        for i in range(self.num_players):  # the tensor gives the payoff of the player moved to the last axis
+            values[:, i] = self.payoff_tensor[tuple(np.delete(profiles, i, axis=1).T) + (profiles[:, i],)]
+        return values.tolist()
+
+    def is_equilibrium(self, profiles):
+        """
+        :param profiles: integer array of shape (batch, num_players), positions of every player
+        :return: list of whether each profile is an equilibrium
+        """
+        is_equilibrium = np.ones(len(profiles), dtype=bool)
+        for i in range(self.num_players):
+            others = tuple(np.delete(profiles, i, axis=1).T)
+            is_equilibrium &= self.index.is_best_response[others + (profiles[:, i],)]
+        return is_equilibrium.tolist()
+
+    def equilibria(self):
+        """
+        :return: list of every equilibrium as lists of positions, computed on the first call
+        """
+        if self._equilibria is None:
+            self._equilibria = [[list(position) for position in equilibrium]
+                                for equilibrium in self.index.equilibria()]
+        return self._equilibria
+
+
+class GameStore:
+    """
+    Bounded LRU cache of loaded games. Games are loaded in a worker thread, and concurrent
+    requests for a game being loaded wait for the same load.
+    """
+
+    def __init__(self, max_games=8, cache=None, data_dir=None, max_profiles=MAX_PROFILES):
+        """
+        :param max_games: number of games kept resident
+        :param cache: PayoffCache games are looked up in and stored to, defaults to payoff_cache.default_cache()
+        :param data_dir: directory .npy tensors can be loaded from by path, none can if not given
+        :param max_profiles: largest number of profiles of a game computed on request, larger ones are refused
+        """
+        self.max_games = max_games
+        self.max_profiles = max_profiles
+        self.cache = cache if cache is not None else payoff_cache.default_cache()
+        self.data_dir = os.path.realpath(data_dir) if data_dir else None
+        self.games = OrderedDict()
+
+    def key(self, spec):
+        """
+        :param spec: dict describing the game, either "path" to a .npy tensor in data_dir with
+        "num_positions" and "dimensions", or "num_positions" with optional "dimensions", "num_players" and "metric"
+        :return: hashable key of the game
+        """
+        if "path" in spec:
+            key = ("path", spec["path"], int(spec["num_positions"]), int(spec.get("dimensions", 1)))
+            if min(key[2:]) < 1:
+                raise ValueError("num_positions and dimensions must be positive.")
+            return key
+        key = (int(spec["num_positions"]), int(spec.get("dimensions", 1)), int(spec.get("num_players", 2)),
+               str(spec.get("metric", "l1")))
+        num_positions, dimensions, num_players, _ = key
+        if min(num_positions, dimensions, num_players) < 1:
+            raise ValueError("num_positions, dimensions and num_players must be positive.")
+        # checked before loading, the tensor has num_positions^(dimensions num_players) payoffs
+        if bounded_power(num_positions, dimensions * num_players, self.max_profiles) is None:
+            raise ValueError(f"Game has more than the limit of {self.max_profiles} profiles, "
+                             f"num_positions^(dimensions num_players).")
+        return key
+
+    def load(self, key):
+        """
+        :param key: key of the game
+        :return: Game, its tensor memory-mapped whenever it comes from a file
+        """
+        if key[0] == "path":
+            _, path, num_positions, dimensions = key
+            if self.data_dir is None:
+                raise ValueError("Loading tensors by path is not enabled.")
+            path = os.path.realpath(os.path.join(self.data_dir, path))
+            if os.path.commonpath([path, self.data_dir]) != self.data_dir:
+                raise ValueError("Paths must be inside the data directory.")
+            payoff_tensor = np.load(path, mmap_mode="r")
+            # a tensor of another game would give wrong answers, or fail on the first query
+            num_spots = bounded_power(num_positions, dimensions, max(payoff_tensor.shape, default=0))
+            if payoff_tensor.ndim < 2 or num_spots is None or payoff_tensor.shape != (num_spots,) * payoff_tensor.ndim:
+                raise ValueError(f"Tensor of shape {payoff_tensor.shape} is not the payoff tensor of a game of "
+                                 f"two or more players on {num_positions} positions in {dimensions} dimensions.")
+            return Game(payoff_tensor, num_positions, dimensions)
+        num_positions, dimensions, num_players, metric = key
+        payoff_tensor = nD.payoff_finder(num_positions, dimensions, num_players, metric, cache=self.cache or False)
+        return Game(payoff_tensor, num_positions, dimensions)
+
+    async def get(self, spec):
+        """
+        :param spec: dict describing the game, see key
+        :return: the loaded Game
+        """
+        key = self.key(spec)
+        if key in self.games:
+            self.games.move_to_end(key)
+        else:
+            self.games[key] = asyncio.get_running_loop().run_in_executor(None, self.load, key)
+            while len(self.games) > self.max_games:
+                self.games.popitem(last=False)  # queries holding the game keep it until they finish
+        loading = self.games[key]
+        try:
+            return await asyncio.shield(loading)
+        except Exception:
+            if self.games.get(key) is loading:  # failed loads are retried on the next request
+                del self.games[key]
+            raise
+
+
+class Coalescer:
+    """
+    Gathers the queries of one kind on one game that arrive together into a single vectorised lookup.
+    """
+
+    def __init__(self, delay=0.0):
+        """
+        :param delay: seconds a query waits for others to join its batch, 0 batches those arriving
+        in the same turn of the event loop
+        """
+        self.delay = delay
+        self.pending = {}
+        self.batches = 0
+        self.queries = 0
+
+    async def submit(self, game, op, rows):
+        """
+        :param game: Game to query
+        :param op: name of the Game method answering the query
+        :param rows: integer array of position indices, one row per profile
+        :return: list of the answers for the rows
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self.pending.setdefault((id(game), op), [])
+        batch.append((rows, future))
+        if len(batch) == 1:
+            loop.call_later(self.delay, self.flush, game, op)
+        return await future
+
+    def flush(self, game, op):
+        batch = self.pending.pop((id(game), op))
+        self.batches += 1
+        self.queries += len(batch)
+        try:
+            results = getattr(game, op)(np.concatenate([rows for rows, _ in batch]))
+        except Exception as error:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        start = 0
+        for rows, future in batch:
+            if not future.done():  # the client may have gone away
+                future.set_result(results[start:start + len(rows)])
+            start += len(rows)
+
+
+class PayoffService:
+    """
+    Answers queries sent as lines of JSON over a local socket, each with an "op", a "game" (see GameStore.key)
+    and an optional "id" copied to the answer. The ops are
+    "best_responses" with "others", a list of profiles of all players but one,
+    "payoffs" and "is_equilibrium" with "profiles", a list of profiles of every player,
+    "equilibria", and "stats". Positions are lists of coordinates, as tuples are in find_best_responses.
+    Requests on one connection are answered as they complete, so answers may come out of order.
+    """
+
+    def __init__(self, max_games=8, cache=None, data_dir=None, coalesce_delay=0.0, max_profiles=MAX_PROFILES):
+        """
+        :param max_games: number of games kept resident
+        :param cache: as in GameStore
+        :param data_dir: as in GameStore
+        :param coalesce_delay: as the delay of Coalescer
+        :param max_profiles: as in GameStore
+        """
+        self.store = GameStore(max_games, cache, data_dir, max_profiles)
+        self.coalescer = Coalescer(coalesce_delay)
+
+    async def answer(self, request):
+        """
+        :param request: decoded request
+        :return: the result of the request
+        """
+        op = request.get("op")
+        if op == "stats":
+            return {"games": len(self.store.games), "queries": self.coalescer.queries,
+                    "batches": self.coalescer.batches}
+        if op not in ("best_responses", "payoffs", "is_equilibrium", "equilibria"):
+            raise ValueError(f"Unknown op {op}.")
+        game = await self.store.get(request["game"])
+        if op == "equilibria":  # a full search on the first call, kept off the event loop
+            return await asyncio.get_running_loop().run_in_executor(None, game.equilibria)
+        if op == "best_responses":
+            rows = game.indices(request["others"], game.num_players - 1)
+        else:
+            rows = game.indices(request["profiles"], game.num_players)
+        return await self.coalescer.submit(game, op, rows)
+
+    async def respond(self, line, writer, lock):
+        request = {}
+        try:
+            request = json.loads(line)
+            response = {"result": await self.answer(request)}
+        except Exception as error:  # reported to the client, the service keeps running
+            response = {"error": f"{type(error).__name__}: {error}"}
+        response["id"] = request.get("id") if isinstance(request, dict) else None
+        async with lock:
+            writer.write((json.dumps(response) + "\n").encode())
+            await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    task = asyncio.create_task(self.respond(line, writer, lock))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=DEFAULT_PORT, path=None):
+        """
+        :param host: address listened on, only the local machine by default
+        :param port: TCP port, 0 picks a free one
+        :param path: if given, a unix socket at this path is listened on instead
+        :return: asyncio server
+        """
+        if path:
+            return await asyncio.start_unix_server(self.handle_connection, path, limit=LINE_LIMIT)
+        return await asyncio.start_server(self.handle_connection, host, port, limit=LINE_LIMIT)
+
+
+class PayoffClient:
+    """
+    Blocking client of a PayoffService, for scripts and notebooks.
+    """
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, path=None):
+        """
+        :param host: address of the service
+        :param port: TCP port of the service
+        :param path: unix socket of the service, used instead of host and port if given
+        """
+        if path:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(path)
+        else:
+            self.socket = socket.create_connection((host, port))
+        self.file = self.socket.makefile("rw")
+        self.next_id = 0
+
+    def request(self, op, game=None, **kwargs):
+        """
+        :param op: name of the query, see PayoffService
+        :param game: dict describing the game, see GameStore.key
+        :param kwargs: arguments of the query, e.g. others or profiles
+        :return: the result of the query
+        """
+        self.next_id += 1
+        self.file.write(json.dumps({"id": self.next_id, "op": op, "game": game, **kwargs}) + "\n")
+        self.file.flush()
+        response = json.loads(self.file.readline())
+        if "error" in response:
+            raise ValueError(response["error"])
+        return response["result"]
+
+    def best_responses(self, game, others):
+        """
+        :param others: list of profiles of all players but one, each a list of positions
+        :return: list of the best responses to each profile
+        """
+        return self.request("best_responses", game, others=others)
+
+    def payoffs(self, game, profiles):
+        """
+        :param profiles: list of profiles of every player
+        :return: list of the payoffs of every player in each profile
+        """
+        return self.request("payoffs", game, profiles=profiles)
+
+    def is_equilibrium(self, game, profiles):
+        """
+        :param profiles: list of profiles of every player
+        :return: list of whether each profile is an equilibrium
+        """
+        return self.request("is_equilibrium", game, profiles=profiles)
+
+    def equilibria(self, game):
+        return self.request("equilibria", game)
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+async def serve(host="127.0.0.1", port=DEFAULT_PORT, path=None, **kwargs):
+    """
+    runs a PayoffService until cancelled
+    :param kwargs: passed to PayoffService
+    """
+    server = await PayoffService(**kwargs).start(host, port, path)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Service answering queries on election game payoff tensors.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="TCP port to listen on")
+    parser.add_argument("--socket", help="unix socket to listen on instead of TCP")
+    parser.add_argument("--max-games", type=int, default=8, help="number of games kept resident")
+    parser.add_argument("--data-dir", help="directory .npy tensors can be loaded from by path")
+    parser.add_argument("--coalesce-delay", type=float, default=0.0, help="seconds queries wait to be batched")
+    parser.add_argument("--max-profiles", type=int, default=MAX_PROFILES,
+                        help="largest number of profiles of a game computed on request")
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.socket, max_games=args.max_games, data_dir=args.data_dir,
+                      coalesce_delay=args.coalesce_delay, max_profiles=args.max_profiles))
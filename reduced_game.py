@@ -0,0 +1,236 @@
+# pure equilibria searched for after removing dominated positions
+
+import numpy as np
+import math
+import nD_equilibria_finder as nD
+import distance_metrics
+from symmetric_payoffs import binomial_table, deviation_payoffs, multiset_rank, sorted_equilibrium_mask, \
+    sorted_profile_batches
+
+
+# largest number of deviation payoffs kept between rounds of elimination, rather than recomputed
+ROW_CACHE_ELEMENTS = 2**24
+
+
+def dominated(payoffs, weak=False, atol=1e-12):
+    """
+    finds the strategies dominated by another, comparing every pair of strategies at once
+    :param payoffs: array of shape (others, m), the payoff of each of m strategies against each profile
+    of the others, or an iterable of such arrays holding the rows a chunk at a time
+    :param weak: if True weakly dominated strategies are found too, else only strictly dominated ones
+    :param atol: payoffs closer than this are taken as equal
+    :return: boolean array of shape (m,), True where the strategy is dominated
+    """
+    chunks = [payoffs] if isinstance(payoffs, np.ndarray) else payoffs
+    always_better = None
+    for chunk in chunks:
+        m = chunk.shape[1]
+        if always_better is None:
+            # entry [a, b] says whether b does better than a, respectively at least as well, against every row
+            always_better = np.ones((m, m), dtype=bool)
+            at_least = np.ones((m, m), dtype=bool)
+            sometimes_better = np.zeros((m, m), dtype=bool)
+        step = max(1, 2**22 // (m * m))
+        for start in range(0, len(chunk), step):
+            rows = chunk[start:start + step]
+            difference = rows[:, None, :] - rows[:, :, None]  # [row, a, b] is payoff of b minus payoff of a
+            better = difference > atol
+            always_better &= better.all(axis=0)
+            if weak:
+                at_least &= (difference > -atol).all(axis=0)
+                sometimes_better |= better.any(axis=0)
+    dominates = at_least & sometimes_better if weak else always_better
+    np.fill_diagonal(dominates, False)
+    return dominates.any(axis=1)
+
+
+class ReducedGame:
+    """
+    The election game after iterated elimination of dominated positions.
+    The game is symmetric, so a position dominated for one player is dominated for all and a single
+    set of surviving positions is kept. Payoffs of the last player only depend on the sorted positions
+    of the others, so each round visits (V + n - 2 choose n - 1) profiles of the others rather than V^n,
+    without forming a dense tensor. Equilibria of the reduced game are equilibria of the full game.
+    """
+
+    def __init__(self, num_positions, dimensions=1, num_players=2, metric="l1", payoff_tensor=None, atol=1e-12):
+        """
+        :param num_positions: number of positions along each dimension
+        :param dimensions: number of dimensions
+        :param num_players: number of players
+        :param metric: grid metric name or precomputed distance matrix, as in nD_equilibria_finder.payoff_finder
+        :param payoff_tensor: payoff tensor as from payoff_finder, looked up instead of computing payoffs if given
+        :param atol: payoffs closer than this are taken as equal
+        """
+        self.num_players = num_players
+        self.num_spots = num_positions**dimensions
+        self.grid_shape = (num_positions,) * dimensions
+        if payoff_tensor is None and num_players == 2 and isinstance(metric, str):
+            payoff_tensor = nD.election_payoffs(num_positions, dimensions, metric)[1]  # cheaper than any round
+        self.payoff_tensor = payoff_tensor
+        if payoff_tensor is None:
+            self.distance_matrix = distance_metrics.get_distances(num_positions, dimensions, metric)
+        self.atol = atol
+        self.surviving = np.arange(self.num_spots)
+        # number of surviving positions after each round of elimination
+        self.history = [self.num_spots]
+        self.best = None
+
+    def payoffs(self, others, own):
+        """
+        :param others: integer array of shape (batch, num_players - 1) of position indices
+        :param own: integer array of shape (batch,) of position indices of the last player
+        :return: payoff of the last player in each profile
+        """
+        if self.payoff_tensor is not None:
+            return self.payoff_tensor[tuple(others.T) + (own,)]
+        profiles = np.column_stack([others, own])
+        return nD.profile_payoffs(profiles, self.distance_matrix, 1/self.num_spots, -1)
+
+    def deviation_payoffs(self, others):
+        """
+        :param others: integer array of shape (batch, num_players - 1) of position indices
+        :return: array of shape (batch, number of surviving positions), the payoff of the last player
+        on each surviving position against each profile of the others
+        """
+        return deviation_payoffs(lambda profiles: self.payoffs(profiles[:, :-1], profiles[:, -1]), others,
+                                 self.surviving)
+
+    @property
+    def num_rows(self):
+        """
+        :return: number of sorted profiles of the other players on the surviving positions
+        """
+        return math.comb(len(self.surviving) + self.num_players - 2, self.num_players - 1)
+
+    def others_batches(self):
+        """
+        :return: generator of (start, others), the sorted profiles of the other players on surviving positions
+        in the order of multiset_rank, as position indices
+        """
+        m = len(self.surviving)
+        batch_size = max(1, nD.BATCH_ELEMENTS // (self.num_players * m))
+        for start, profiles in sorted_profile_batches(m, self.num_players - 1, batch_size):
+            yield start, self.surviving[profiles]
+
+    def eliminate(self, weak=False, max_rounds=None, debug=False):
+        """
+        removes dominated positions until none are left, keeping the best payoff against each profile
+        of the others in the last round for the equilibrium search
+        :param weak: if True weakly dominated positions are removed too, which shrinks the game further
+        but can lose some equilibria (those left are still equilibria of the full game)
+        :param max_rounds: largest number of rounds, unlimited by default
+        :param debug: if True the positions left and the reduction ratio are printed after each round
+        :return: array of the flat indices of the surviving positions
+        """
+        rounds = 0
+        rows = None  # deviation payoffs against every profile of the others, when small enough to keep
+        while max_rounds is None or rounds < max_rounds:
+            if rows is None and self.num_rows * len(self.surviving) <= ROW_CACHE_ELEMENTS:
+                rows = np.concatenate([self.deviation_payoffs(others) for _, others in self.others_batches()])
+            if rows is None:  # too many to keep, the rows are recomputed a batch at a time each round
+                is_dominated = dominated((self.deviation_payoffs(others) for _, others in self.others_batches()),
+                                         weak, self.atol)
+            else:
+                is_dominated = dominated(rows, weak, self.atol)
+            rounds += 1
+            if not is_dominated.any():
+                if rows is None:
+                    self.best = np.empty(self.num_rows)
+                    for start, others in self.others_batches():
+                        self.best[start:start + len(others)] = self.deviation_payoffs(others).max(axis=1)
+                else:
+                    self.best = rows.max(axis=1)
+                break
+            if rows is not None:
+                rows = self.restrict(rows, ~is_dominated)
+            self.surviving = self.surviving[~is_dominated]
+            self.history.append(len(self.surviving))
+            if debug:
+                print(f"Round {rounds}: {len(self.surviving)} positions left, reduction ratio {self.reduction_ratio:.3g}")
+        return self.surviving
+
+    def restrict(self, rows, keep):
+        """
+        :param rows: deviation payoffs against every sorted profile of the others on the surviving positions
+        :param keep: boolean array, True for the surviving positions kept
+        :return: the rows and columns of the positions kept, as if computed for them
+        """
+        m = len(self.surviving)
+        binomials = binomial_table(m + self.num_players - 2, self.num_players - 1)
+        kept = np.flatnonzero(keep)
+        # sorted profiles of the kept positions, as indices into the current surviving positions
+        others = np.concatenate([kept[profiles] for _, profiles in
+                                 sorted_profile_batches(len(kept), self.num_players - 1, nD.BATCH_ELEMENTS)])
+        return rows[multiset_rank(others, m, binomials)][:, kept]
+
+    @property
+    def reduction_ratio(self):
+        """
+        :return: fraction of the profiles of the full game left in the reduced game
+        """
+        return (len(self.surviving) / self.num_spots)**self.num_players
+
+    def position(self, index):
+        return tuple(int(x) for x in np.unravel_index(index, self.grid_shape))
+
+    def equilibria(self, rtol=1e-12):
+        """
+        finds the pure equilibria of the reduced game, eliminating dominated positions first if not done yet
+        :param rtol: relative tolerance when comparing payoffs with the best payoff, as in find_best_responses
+        :return: list of equilibria up to permutation of the players, each a tuple of positions
+        sorted by position index
+        """
+        if self.best is None:
+            self.eliminate()
+        m = len(self.surviving)
+        binomials = binomial_table(m + self.num_players - 1, self.num_players)
+        equilibria = []
+        batch_size = max(1, nD.BATCH_ELEMENTS // self.num_players)
+        for _, profiles in sorted_profile_batches(m, self.num_players, batch_size):
+            positions = self.surviving[profiles]
+            if self.payoff_tensor is None:  # every player's payoff from one pass over the spaces
+                values = nD.profile_payoffs(positions, self.distance_matrix, 1/self.num_spots)
+            else:
+                values = np.column_stack([self.payoffs(np.delete(positions, k, axis=1), positions[:, k])
+                                          for k in range(self.num_players)])
+            is_equilibrium = sorted_equilibrium_mask(profiles, values, self.best, m, binomials, rtol)
+            equilibria.extend(tuple(self.position(k) for k in self.surviving[profile])
+                              for profile in profiles[is_equilibrium])
+        return equilibria
+
+    def best_response_dynamics(self, num_starts=64, max_sweeps=100, seed=0, starts=None, rtol=1e-12):
+        """
+        runs best response dynamics from many starting profiles at once on the surviving positions.
+        Players move in turn to their best response, staying put when already playing one,
+        and a profile where nobody moves in a whole sweep is an equilibrium
+        :param num_starts: number of random starting profiles, ignored if starts is given
+        :param max_sweeps: number of sweeps through the players after which the remaining runs are given up
+        :param seed: seed of the random starting profiles
+        :param starts: integer array of shape (batch, num_players) of flat position indices to start from
+        :param rtol: relative tolerance when comparing payoffs with the best payoff
+        :return: list of the distinct equilibria found, as in equilibria
+        """
+        if starts is None:
+            rng = np.random.default_rng(seed)
+            profiles = rng.choice(self.surviving, size=(num_starts, self.num_players))
+        else:
+            profiles = np.array(starts, dtype=np.intp)
+        converged = np.zeros(len(profiles), dtype=bool)
+        for _ in range(max_sweeps):
+            running = np.flatnonzero(~converged)
+            if len(running) == 0:
+                break
+            moved = np.zeros(len(running), dtype=bool)
+            for k in range(self.num_players):
+                current = profiles[running]
+                others = np.sort(np.delete(current, k, axis=1), axis=1)
+                rows = self.deviation_payoffs(others)
+                best = rows.max(axis=1)
+                own = self.payoffs(others, current[:, k])
+                move = ~np.isclose(own, best, rtol)
+                profiles[running[move], k] = self.surviving[rows[move].argmax(axis=1)]
+                moved |= move
+            converged[running[~moved]] = True
+        found = {tuple(sorted(int(x) for x in profile)) for profile in profiles[converged]}
+        return [tuple(self.position(k) for k in profile) for profile in sorted(found)]
@@ -0,0 +1,160 @@
+# pure equilibria found one batch of profiles at a time, without a dense payoff tensor
+
+import numpy as np
+import json
+import math
+from collections import OrderedDict
+from contextlib import nullcontext
+import nD_equilibria_finder as nD
+import distance_metrics
+from symmetric_payoffs import deviation_payoffs, sorted_profile_batches
+
+
+class StreamingEquilibriumFinder:
+    """
+    Enumerates pure equilibria computing payoffs only when needed.
+    The best payoff against the other players only depends on their sorted positions,
+    so it is kept in a bounded LRU cache shared by neighbouring profiles.
+    """
+
+    def __init__(self, num_positions, dimensions=1, num_players=2, metric="l1", cache_size=2**16, rtol=1e-12,
+                 metrics=None):
+        """
+        :param num_positions: number of positions along each dimension
+        :param dimensions: number of dimensions
+        :param num_players: number of players
+        :param metric: grid metric name or precomputed distance matrix, as in nD.payoff_finder
+        (a distance_metrics.LazyDistances keeps memory small on very large grids)
+        :param cache_size: largest number of best payoffs kept in the cache
+        :param rtol: relative tolerance when comparing payoffs with the best payoff, as in find_best_responses
+        :param metrics: instrumentation.RunMetrics receiving the profiles checked, the time split between
+        the "payoffs", "deviations" (best payoffs of deviating players) and "best_responses" phases
+        and the hits of the best payoff cache
+        """
+        self.num_players = num_players
+        self.num_spots = num_positions**dimensions
+        self.grid_shape = (num_positions,) * dimensions
+        self.distance_matrix = distance_metrics.get_distances(num_positions, dimensions, metric)
+        self.square_weight = 1/self.num_spots
+        self.cache_size = cache_size
+        self.rtol = rtol
+        self.best_cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.metrics = metrics
+
+    def best_payoffs(self, others):
+        """
+        best payoff available to a player against each profile of the other players
+        :param others: integer array of shape (batch, num_players - 1), each row sorted
+        :return: array of shape (batch,)
+        """
+        best = np.empty(len(others))
+        missing = {}
+        for k, key in enumerate(map(tuple, others.tolist())):
+            if key in self.best_cache:
+                self.best_cache.move_to_end(key)
+                best[k] = self.best_cache[key]
+                self.hits += 1
+            else:
+                missing.setdefault(key, []).append(k)
+                self.misses += 1
+
+        keys = list(missing)
+        chunk = max(1, nD.BATCH_ELEMENTS // (self.num_players * self.num_spots))
+        for start in range(0, len(keys), chunk):
+            chunk_keys = keys[start:start + chunk]
+            others = np.array(chunk_keys, dtype=np.intp).reshape(len(chunk_keys), -1)
+            rows = deviation_payoffs(self.last_payoffs, others, np.arange(self.num_spots))
+            for key, value in zip(chunk_keys, rows.max(axis=1)):
+                best[missing[key]] = value
+                self.best_cache[key] = value
+                if len(self.best_cache) > self.cache_size:
+                    self.best_cache.popitem(last=False)
+        return best
+
+    def phase(self, name):
+        """
+        :return: context manager timing a phase in the metrics, if any
+        """
+        return self.metrics.phase(name) if self.metrics else nullcontext()
+
+    def last_payoffs(self, profiles):
+        """
+        :param profiles: integer array of shape (batch, num_players) of position indices
+        :return: payoff of the last player in each profile
+        """
+        return nD.profile_payoffs(profiles, self.distance_matrix, self.square_weight, -1)
+
+    def profile_batches(self, canonical):
+        """
+        :param canonical: if True only sorted profiles, otherwise every profile in the order of find_equilibria
+        :return: generator of integer arrays of shape (batch, num_players)
+        """
+        batch_size = max(1, nD.BATCH_ELEMENTS // self.num_players)
+        if canonical:
+            for _, profiles in sorted_profile_batches(self.num_spots, self.num_players, batch_size):
+                yield profiles
+            return
+        shape = (self.num_spots,) * self.num_players
+        total = self.num_spots**self.num_players
+        for start in range(0, total, batch_size):
+            yield np.stack(np.unravel_index(np.arange(start, min(start + batch_size, total)), shape), axis=1)
+
+    def equilibria(self, canonical=True, output_path=None):
+        """
+        yields the equilibria as they are found, memory use stays bounded by the batch and cache sizes
+        :param canonical: if True only sorted profiles are visited, so each equilibrium appears once
+        up to permutation of the players
+        :param output_path: if given, each equilibrium is also appended to this file as a line of JSON
+        :return: generator of equilibria, each a tuple of positions as in find_equilibria
+        """
+        output = open(output_path, "a") if output_path else None
+        if canonical:
+            total = math.comb(self.num_spots + self.num_players - 1, self.num_players)
+        else:
+            total = self.num_spots**self.num_players
+        done = 0
+        if self.metrics:
+            self.metrics.progress("profiles", 0, total)
+        try:
+            for profiles in self.profile_batches(canonical):
+                hits, misses = self.hits, self.misses
+                with self.phase("payoffs"):
+                    payoffs = nD.profile_payoffs(profiles, self.distance_matrix, self.square_weight)
+                with self.phase("deviations"):
+                    best = np.column_stack([self.best_payoffs(np.sort(np.delete(profiles, i, axis=1), axis=1))
+                                            for i in range(self.num_players)])
+                with self.phase("best_responses"):
+                    is_equilibrium = np.all(np.isclose(payoffs, best, self.rtol), axis=1)
+                done += len(profiles)
+                if self.metrics:
+                    self.metrics.count("best_cache.hits", self.hits - hits)
+                    self.metrics.count("best_cache.misses", self.misses - misses)
+                    self.metrics.progress("profiles", done, total)
+                for profile in profiles[is_equilibrium]:
+                    equilibrium = tuple(tuple(int(x) for x in np.unravel_index(k, self.grid_shape))
+                                        for k in profile)
+                    if output:
+                        output.write(json.dumps(equilibrium) + "\n")
+                    yield equilibrium
+                if output:
+                    output.flush()
+        finally:
+            if output:
+                output.close()
+
+
+def stream_equilibria(num_positions, dimensions=1, num_players=2, canonical=True, output_path=None, **kwargs):
+    """
+    generator of the equilibria of the election game, see StreamingEquilibriumFinder
+    :param num_positions: number of positions along each dimension
+    :param dimensions: number of dimensions
+    :param num_players: number of players
+    :param canonical: if True only sorted profiles are visited
+    :param output_path: file each equilibrium is appended to as it is found
+    :param kwargs: passed to StreamingEquilibriumFinder
+    :return: generator of equilibria as tuples of positions
+    """
+    finder = StreamingEquilibriumFinder(num_positions, dimensions, num_players, **kwargs)
+    return finder.equilibria(canonical, output_path)
@@ -1,13 +1,17 @@
-import nashpy as nash
+import importlib
 import nD_equilibria_finder as equib
 import numpy as np
 #Attempt to find mixed equilibria of a 2D small political game
+# (the module name starts with a digit, so it cannot be imported with an import statement)
+mixed = importlib.import_module("2player_mixed_equilibria_finder")
 num_positions = 3
 payoff = equib.payoff_finder(num_positions,2,2)
-deg_game = nash.Game(payoff.transpose(), (np.ones([num_positions**2,num_positions**2])-payoff).transpose())
-eq = deg_game.support_enumeration()
-for eq in eq:
-    print(eq)
+# the game is constant-sum, so a linear program finds an equilibrium without enumerating supports
+start = np.ones(num_positions**2)/num_positions**2
+finder = mixed.MixedEquilibriumFinder(np.array([payoff.transpose(), (np.ones([num_positions**2,num_positions**2])-payoff).transpose()]), start, start)
+result = finder.solve("linear_program")
+print(result)
+print(result.strategy)
 print(equib.find_equilibria(3,2,2))
 
 
@@ -0,0 +1,197 @@
+# payoffs of the election game stored once per multiset of positions
+
+import numpy as np
+import itertools
+import nD_equilibria_finder as nD
+import distance_metrics
+
+
+def binomial_table(n, r):
+    """
+    table of binomial coefficients built from Pascal's triangle
+    :param n: largest top argument
+    :param r: largest bottom argument
+    :return: integer array where entry [m, k] is m choose k
+    """
+    table = np.zeros((n + 1, r + 1), dtype=np.int64)
+    table[:, 0] = 1
+    for m in range(1, n + 1):
+        table[m, 1:] = table[m - 1, 1:] + table[m - 1, :-1]
+    return table
+
+
+def multiset_rank(sorted_profiles, num_spots, binomials):
+    """
+    position of sorted profiles in the order of itertools.combinations_with_replacement
+    :param sorted_profiles: integer array of shape (batch, size), each row non-decreasing
+    :param num_spots: number of positions each entry is drawn from
+    :param binomials: binomial_table covering num_spots + size - 1 choose size
+    :return: integer array of shape (batch,)
+    """
+    sorted_profiles = np.asarray(sorted_profiles)
+    size = sorted_profiles.shape[-1]
+    total = num_spots + size - 1
+    # shifting the k-th entry by k turns the multiset into a strictly increasing combination
+    combination = sorted_profiles + np.arange(size)
+    complement = binomials[total - 1 - combination, size - np.arange(size)]
+    return binomials[total, size] - 1 - complement.sum(axis=-1)
+
+
+def deviation_payoffs(last_payoffs, others, positions):
+    """
+    payoff of a last player moving to each of the positions, against each profile of the others
+    :param last_payoffs: function taking an integer array of shape (batch, size + 1) of profiles
+    and returning the payoff of the last player in each
+    :param others: integer array of shape (batch, size), positions of the other players
+    :param positions: integer array of the positions the last player can take
+    :return: array of shape (len(others), len(positions)), its maximum along axis 1 is the best payoff
+    """
+    deviations = np.empty((len(others), len(positions), others.shape[1] + 1), dtype=np.intp)
+    deviations[:, :, :-1] = others[:, None, :]
+    deviations[:, :, -1] = positions
+    return last_payoffs(deviations.reshape(-1, others.shape[1] + 1)).reshape(len(others), len(positions))
+
+
+def sorted_equilibrium_mask(profiles, payoffs, best, num_spots, binomials, rtol=1e-12):
+    """
+    checks which sorted profiles are equilibria, given the best payoff against each sorted profile of the others
+    :param profiles: integer array of shape (batch, num_players), each row non-decreasing
+    :param payoffs: array of shape (batch, num_players), the payoff of each player
+    :param best: best payoff against the others, indexed by multiset_rank of the others
+    :param num_spots: number of positions the profiles are drawn from
+    :param binomials: binomial_table covering num_spots + num_players - 2 choose num_players - 1
+    :param rtol: relative tolerance when comparing payoffs with the best payoff, as in np.isclose
+    :return: boolean array of shape (batch,)
+    """
+    is_equilibrium = np.ones(len(profiles), dtype=bool)
+    for k in range(profiles.shape[1]):  # removing one player keeps the others sorted
+        others = np.delete(profiles, k, axis=1)
+        is_equilibrium &= np.isclose(payoffs[:, k], best[multiset_rank(others, num_spots, binomials)], rtol)
+    return is_equilibrium
+
+
+def sorted_profile_batches(num_spots, size, batch_size):
+    """
+    generates all sorted profiles in the order of itertools.combinations_with_replacement
+    :param num_spots: number of positions
+    :param size: number of players in each profile
+    :param batch_size: number of profiles per batch
+    :return: generator of (start, profiles), profiles an integer array of shape (batch, size)
+    """
+    sorted_profiles = itertools.combinations_with_replacement(range(num_spots), size)
+    start = 0
+    while True:
+        batch = itertools.islice(sorted_profiles, batch_size)
+        profiles = np.fromiter(itertools.chain.from_iterable(batch), dtype=np.intp).reshape(-1, size)
+        if len(profiles) == 0:
+            return
+        yield start, profiles
+        start += len(profiles)
+
+
+class SymmetricPayoffs:
+    """
+    Payoffs of the election game stored once per sorted profile.
+    The game is invariant under permuting the players, so the payoffs of any profile are the
+    payoffs of its sorted profile permuted back, cutting storage by roughly num_players!.
+    """
+
+    def __init__(self, num_positions, dimensions=1, num_players=2, metric="l1"):
+        """
+        computes the payoff of every player in every sorted profile
+        :param num_positions: number of positions along each dimension
+        :param dimensions: number of dimensions
+        :param num_players: number of players
+        :param metric: grid metric name or precomputed distance matrix, as in nD_equilibria_finder.payoff_finder
+        """
+        self.num_positions = num_positions
+        self.dimensions = dimensions
+        self.num_players = num_players
+        self.num_spots = num_positions**dimensions
+        # sorted profiles of n players on V spots correspond to n-subsets of V+n-1 items
+        self._binomials = binomial_table(self.num_spots + num_players - 1, num_players)
+        self.num_profiles = int(self._binomials[self.num_spots + num_players - 1, num_players])
+
+        square_weight = 1/self.num_spots
+        distance_matrix = distance_metrics.get_distances(num_positions, dimensions, metric)
+        # entry [r, k] is the payoff of the k-th player in the sorted profile of rank r
+        self.values = np.zeros((self.num_profiles, num_players))
+        batch_size = max(1, nD.BATCH_ELEMENTS // num_players)
+        for start, profiles in sorted_profile_batches(self.num_spots, num_players, batch_size):
+            self.values[start:start + len(profiles)] = nD.profile_payoffs(profiles, distance_matrix, square_weight)
+
+    def rank(self, sorted_profiles):
+        """
+        position of sorted profiles in the order of itertools.combinations_with_replacement
+        :param sorted_profiles: integer array of shape (batch, num_players), each row non-decreasing
+        :return: integer array of shape (batch,)
+        """
+        return multiset_rank(sorted_profiles, self.num_spots, self._binomials)
+
+    def payoffs(self, profiles):
+        """
+        looks up the payoff of every player for a batch of profiles in any order
+        :param profiles: integer array of shape (batch, num_players) giving position indices
+        :return: array of shape (batch, num_players) of payoffs
+        """
+        profiles = np.asarray(profiles)
+        order = np.argsort(profiles, axis=1, kind="stable")
+        sorted_payoffs = self.values[self.rank(np.take_along_axis(profiles, order, axis=1))]
+        payoffs = np.empty(sorted_payoffs.shape)
+        np.put_along_axis(payoffs, order, sorted_payoffs, axis=1)
+        return payoffs
+
+    def payoff(self, profile, player):
+        """
+        :param profile: sequence of position indices, one per player
+        :param player: index of the player
+        :return: payoff of the player
+        """
+        return self.payoffs(np.array([profile]))[0, player]
+
+    def dense(self, player=-1):
+        """
+        expands the stored payoffs into a full tensor for one player
+        :param player: index of the player whose payoffs are returned, by default the last,
+        which gives the tensor returned by nD_equilibria_finder.payoff_finder
+        :return: tensor of shape (num_spots,)*num_players
+        """
+        payoff_tensor = np.zeros((self.num_spots,) * self.num_players)
+        flat_payoffs = payoff_tensor.reshape(-1)
+        batch_size = max(1, nD.BATCH_ELEMENTS // self.num_players)
+        for start in range(0, flat_payoffs.size, batch_size):
+            stop = min(start + batch_size, flat_payoffs.size)
+            profiles = np.stack(np.unravel_index(np.arange(start, stop), payoff_tensor.shape), axis=1)
+            flat_payoffs[start:stop] = self.payoffs(profiles)[:, player]
+        return payoff_tensor
+
+    def best_payoffs(self):
+        """
+        best payoff available to a player against each sorted profile of the other players
+        :return: array of length (num_spots + num_players - 2 choose num_players - 1),
+        indexed by multiset_rank of the other players
+        """
+        others = self.num_players - 1
+        num_others = int(self._binomials[self.num_spots + others - 1, others])
+        best = np.empty(num_others)
+        batch_size = max(1, nD.BATCH_ELEMENTS // (self.num_players * self.num_spots))
+        for start, profiles in sorted_profile_batches(self.num_spots, others, batch_size):
+            rows = deviation_payoffs(lambda deviations: self.payoffs(deviations)[:, -1], profiles,
+                                     np.arange(self.num_spots))
+            best[start:start + len(profiles)] = rows.max(axis=1)
+        return best
+
+    def equilibria(self, rtol=1e-12):
+        """
+        finds the equilibria up to permutation of the players, without forming any dense tensor
+        :param rtol: relative tolerance when comparing payoffs with the best payoff, as in np.isclose
+        :return: list of equilibria as sorted tuples of position indices
+        """
+        best = self.best_payoffs()
+        equilibria = []
+        batch_size = max(1, nD.BATCH_ELEMENTS // self.num_players)
+        for start, profiles in sorted_profile_batches(self.num_spots, self.num_players, batch_size):
+            is_equilibrium = sorted_equilibrium_mask(profiles, self.values[start:start + len(profiles)], best,
+                                                     self.num_spots, self._binomials, rtol)
+            equilibria.extend(tuple(int(x) for x in profile) for profile in profiles[is_equilibrium])
+        return equilibria
@@ -1,5 +1,17 @@
 import numpy as np
 import itertools
+import importlib
+import nD_equilibria_finder as nD
+import distance_metrics
+from weighted_payoffs import WeightedPayoffs
+from streaming_equilibria import stream_equilibria
+import reduced_game
+import asyncio
+from payoff_service import PayoffService
+import compressed_payoffs
+from PayoffPlotter import PayoffSampler, PayoffRegion, get_election_payoffs
+import tempfile
+import os
 
 arr =[1,2]
 iterator = itertools.product(arr, repeat=2)
@@ -7,5 +19,185 @@ for i in iterator:
     print(i)
 
 
+# consistency of the shared two player election kernel with the other implementations
+def election_payoffs_loop(n):
+    # the loop PayoffPlotter.get_election_payoffs used before the shared kernel
+    payoffs = []
+    for aStrat in range(n):
+        for bStrat in range(n):
+            aPay = 0
+            bPay = 0
+            for k in range(n):
+                aDist = abs(aStrat-k)
+                bDist = abs(bStrat-k)
+                if aDist < bDist:
+                    bPay += 1/n
+                elif bDist < aDist:
+                    aPay += 1/n
+                else:
+                    aPay += 1/(2*n)
+                    bPay += 1/(2*n)
+            payoffs.append((aPay, bPay))
+    return payoffs
 
 
+for n in [1, 2, 5, 10, 21]:
+    # the loop credited each candidate with the spaces closer to the other, so its columns are swapped
+    assert np.allclose(get_election_payoffs(n), np.array(election_payoffs_loop(n))[:, ::-1])
+    payoffs_0, payoffs_1 = nD.election_payoffs(n, ordered=True)
+    assert np.allclose(np.column_stack([payoffs_0.ravel(), payoffs_1.ravel()]), get_election_payoffs(n))
+
+for num_positions, dimensions in [(5, 1), (4, 2), (7, 2), (3, 3), (2, 4)]:
+    for metric in distance_metrics.METRICS:
+        # the n player engine, with the payoff of the last of two players
+        payoff_tensor = np.zeros((num_positions**dimensions,) * 2)
+        nD.fill_payoffs(payoff_tensor, 0, payoff_tensor.size,
+                        distance_metrics.grid_distances(num_positions, dimensions, metric), 1/num_positions**dimensions)
+        payoffs_0, payoffs_1 = nD.election_payoffs(num_positions, dimensions, metric)
+        assert np.allclose(payoffs_1, payoff_tensor) and np.allclose(payoffs_0, payoff_tensor.T)
+        payoffs_0, payoffs_1 = nD.election_payoffs(num_positions, dimensions, metric, ordered=True)
+        assert np.array_equal(payoffs_1, payoff_tensor) and np.array_equal(payoffs_0, payoff_tensor.T)
+
+assert np.array_equal(nD.payoff_finder(20, 2, 2, cache=False), np.load("payoffs_20_2_2.npy"))
+print("election payoff kernel consistent")
+
+
+# the best response index finds the same equilibria, in the same order, as checking every profile
+def find_equilibria_loop(num_positions, dimensions, num_players, payoff_tensor):
+    # the loop find_equilibria used before BestResponseIndex
+    position_list = list(itertools.product(range(num_positions), repeat=dimensions))
+    equilibria = []
+    for pos in itertools.product(position_list, repeat=num_players):
+        if all(spot in nD.find_best_responses(pos[:i] + pos[i + 1:], payoff_tensor, num_positions, dimensions)
+               for i, spot in enumerate(pos)):
+            equilibria.append(pos)
+    return equilibria
+
+
+for num_positions, dimensions, num_players in [(6, 1, 2), (5, 1, 3), (3, 2, 3), (4, 2, 2)]:
+    payoff_tensor = nD.payoff_finder(num_positions, dimensions, num_players, cache=False)
+    index = nD.BestResponseIndex(payoff_tensor, num_positions, dimensions)
+    equilibria = find_equilibria_loop(num_positions, dimensions, num_players, payoff_tensor)
+    assert index.equilibria() == equilibria == nD.find_equilibria(num_positions, dimensions, num_players, payoff_tensor)
+    others = [(0,) * dimensions] * (num_players - 1)
+    assert index.best_responses(others) == nD.find_best_responses(others, payoff_tensor, num_positions, dimensions)
+print("best response index consistent")
+
+
+# streaming the profiles finds the same equilibria as the dense search
+for num_positions, dimensions, num_players in [(6, 1, 2), (4, 2, 3), (6, 1, 4)]:
+    equilibria = nD.find_equilibria(num_positions, dimensions, num_players)
+    assert list(stream_equilibria(num_positions, dimensions, num_players, canonical=False)) == equilibria
+    assert list(stream_equilibria(num_positions, dimensions, num_players, cache_size=16)) == \
+        sorted(dict.fromkeys(tuple(sorted(equilibrium)) for equilibrium in equilibria))
+print("streaming equilibria consistent")
+
+
+# the sorted profile search finds the same equilibria as the dense one dimensional finder
+one_dim = importlib.import_module("1D_equilibria_finder")
+for num_positions, num_players in [(10, 2), (11, 3), (11, 4), (8, 5)]:
+    equilibria, count = one_dim.get_equilibria_for_players(num_positions, num_players)
+    unique = one_dim.get_unique_equilibria_for_players(num_positions, num_players)
+    assert sorted({tuple(sorted(equilibrium)) for equilibrium in equilibria}) == unique
+    assert one_dim.count_equilibria(unique) == count
+print("one dimensional equilibria consistent")
+
+
+# incremental updates of a weighted electorate agree with rebuilding it
+rng = np.random.default_rng(0)
+weights = rng.random(25)
+weighted = WeightedPayoffs(5, 2, 3, weights=weights)
+spaces = [3, 7, 12]
+weights[spaces] = [0.5, 0, 2]
+weighted.set_weights(spaces, [0.5, 0, 2])
+assert np.allclose(weighted.payoff_tensor, nD.payoff_finder(5, 2, 3, weights=weights, cache=False))
+print("weighted payoff updates consistent")
+
+
+# compressed payoffs give the same best responses as the dense tensor
+payoff_tensor = np.load("payoffs_20_2_2.npy")
+with tempfile.TemporaryDirectory() as directory:
+    path = os.path.join(directory, "payoffs_20_2_2.payz")
+    compressed_payoffs.save_compressed(path, payoff_tensor)
+    compressed = compressed_payoffs.load_compressed(path)
+    assert np.allclose(compressed.dense(), payoff_tensor)
+    for position in [(18, 18), (16, 17), (0, 0)]:
+        assert nD.find_best_responses([position], compressed, 20, 2) == nD.find_best_responses([position], payoff_tensor, 20, 2)
+    print(f"compressed payoffs consistent, {payoff_tensor.nbytes / compressed.nbytes:.1f}x smaller")
+
+
+# strict elimination of dominated positions keeps every equilibrium, weak elimination a subset of them
+def canonical_equilibria(equilibria, num_positions, dimensions):
+    flat = lambda position: np.ravel_multi_index(position, (num_positions,) * dimensions)
+    return {tuple(sorted(equilibrium, key=flat)) for equilibrium in equilibria}
+
+
+for num_positions, dimensions, num_players in [(10, 1, 2), (11, 1, 3), (7, 2, 2), (5, 2, 3)]:
+    full = canonical_equilibria(nD.find_equilibria(num_positions, dimensions, num_players), num_positions, dimensions)
+    game = reduced_game.ReducedGame(num_positions, dimensions, num_players)
+    assert canonical_equilibria(game.equilibria(), num_positions, dimensions) == full
+    game = reduced_game.ReducedGame(num_positions, dimensions, num_players)
+    game.eliminate(weak=True)
+    assert canonical_equilibria(game.equilibria(), num_positions, dimensions) <= full
+
+# deviation rows streamed a batch at a time each round give the same reduction as kept ones
+row_cache_elements = reduced_game.ROW_CACHE_ELEMENTS
+for num_positions, dimensions, num_players in [(11, 1, 3), (5, 2, 3)]:
+    kept = reduced_game.ReducedGame(num_positions, dimensions, num_players)
+    kept.eliminate()
+    reduced_game.ROW_CACHE_ELEMENTS = 0
+    streamed = reduced_game.ReducedGame(num_positions, dimensions, num_players)
+    streamed.eliminate()
+    reduced_game.ROW_CACHE_ELEMENTS = row_cache_elements
+    assert streamed.history == kept.history and np.array_equal(streamed.best, kept.best)
+print("reduced game equilibria consistent")
+
+# the service gives the answers of the functions it wraps, and refuses tensors of another game
+async def service_answers(directory):
+    service = PayoffService(cache=False, data_dir=directory)
+    game = {"num_positions": 6, "dimensions": 1, "num_players": 4}
+    payoff_tensor = nD.payoff_finder(6, 1, 4, cache=False)
+    equilibria = await service.answer({"op": "equilibria", "game": game})
+    assert {tuple(map(tuple, equilibrium)) for equilibrium in equilibria} == set(nD.find_equilibria(6, 1, 4))
+    others = [[[1], [4], [2]], [[2], [2], [2]], [[0], [5], [5]]]
+    best_responses = await service.answer({"op": "best_responses", "game": game, "others": others})
+    assert [list(map(tuple, best)) for best in best_responses] == \
+        [nD.find_best_responses(list(map(tuple, profile)), payoff_tensor, 6, 1) for profile in others]
+    payoffs = await service.answer({"op": "payoffs", "game": game, "profiles": [[[1], [4], [2], [0]]]})
+    assert payoffs == [[payoff_tensor[4, 2, 0, 1], payoff_tensor[1, 2, 0, 4], payoff_tensor[1, 4, 0, 2],
+                        payoff_tensor[1, 4, 2, 0]]]
+
+    np.save(os.path.join(directory, "payoffs.npy"), payoff_tensor)
+    for num_positions, dimensions in [(5, 1), (6, 2)]:  # the tensor is of 6 positions in 1 dimension
+        try:
+            await service.answer({"op": "equilibria", "game": {"path": "payoffs.npy", "num_positions": num_positions,
+                                                               "dimensions": dimensions}})
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("Tensor of another game was loaded.")
+    assert len(service.store.games) == 1  # failed loads are not kept
+    try:
+        service.store.key({"num_positions": 10**6, "num_players": 10**6})
+    except ValueError as error:
+        assert len(str(error)) < 200
+    else:
+        raise AssertionError("Game over the profile limit was accepted.")
+
+
+with tempfile.TemporaryDirectory() as directory:
+    asyncio.run(service_answers(directory))
+print("payoff service consistent")
+
+# the region of mixed payoffs: the hull segment for the constant sum election game, an area otherwise
+region = PayoffRegion(PayoffSampler([tuple(payoffs) for payoffs in get_election_payoffs(10)], n_A=10))
+assert len(region.boundary()) == 1 and len(region.boundary()[0]) == 2
+rng = np.random.default_rng(0)
+payoffs_A, payoffs_B = rng.normal(size=(2, 4, 4))
+sampler = PayoffSampler(list(zip(payoffs_A.ravel(), payoffs_B.ravel())), n_A=4, seed=0)
+region = PayoffRegion(sampler)
+assert region.contains(np.column_stack([payoffs_A.ravel(), payoffs_B.ravel()])).all()
+assert region.contains(sampler.sample_naive(1000)).all()
+points = rng.uniform(-3, 3, size=(2000, 2))
+assert np.array_equal(region.contains(points), region.covered(points))
+print("payoff region consistent")
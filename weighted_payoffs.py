@@ -0,0 +1,75 @@
+# payoffs of the election game for a non-uniform electorate, updated as the voter weights change
+
+import numpy as np
+import nD_equilibria_finder as nD
+import distance_metrics
+
+
+class WeightedPayoffs:
+    """
+    Payoff tensor of an electorate with its own weight of voters on each space.
+    Each space adds to the payoffs independently of the others, so changing the weights of k spaces
+    only recomputes their contribution, about k/num_spots of a full rebuild, which makes sweeps
+    over voter distributions cheap.
+    """
+
+    def __init__(self, num_positions, dimensions=1, num_players=2, metric="l1", weights=None):
+        """
+        :param num_positions: number of positions along each dimension
+        :param dimensions: number of dimensions
+        :param num_players: number of players
+        :param metric: grid metric name or precomputed distance matrix, as in nD_equilibria_finder.payoff_finder
+        :param weights: voters on each space, see nD_equilibria_finder.space_weights, by default uniform
+        """
+        self.num_positions = num_positions
+        self.dimensions = dimensions
+        self.num_players = num_players
+        self.num_spots = num_positions**dimensions
+        self.distance_matrix = distance_metrics.get_distances(num_positions, dimensions, metric)
+        if weights is None:
+            self.weights = np.full(self.num_spots, 1/self.num_spots)
+        else:
+            self.weights = nD.space_weights(num_positions, dimensions, weights).copy()
+        self.payoff_tensor = np.zeros((self.num_spots,) * num_players)
+        self.rebuild()
+
+    def rebuild(self):
+        """
+        recomputes the whole tensor from the current weights, clearing the rounding error
+        that many updates accumulate
+        """
+        nD.fill_payoffs(self.payoff_tensor, 0, self.payoff_tensor.size, self.distance_matrix, self.weights)
+
+    def set_weights(self, spaces, weights, metrics=None):
+        """
+        changes the weights of some spaces, updating the payoffs by the change in their contribution
+        :param spaces: flat indices of the spaces, np.ravel_multi_index gives them from grid positions
+        :param weights: new weight of each space, or a single weight for all of them
+        :param metrics: instrumentation.RunMetrics receiving the progress of the update
+        """
+        spaces = np.asarray(spaces, dtype=np.intp).reshape(-1)
+        if len(np.unique(spaces)) != len(spaces):
+            raise ValueError("Each space can only be given once.")
+        weights = np.broadcast_to(np.asarray(weights, dtype=float), spaces.shape)
+        if np.any(weights < 0):
+            raise ValueError("Weights must be non-negative.")
+        changed = weights != self.weights[spaces]
+        spaces, weights = spaces[changed], weights[changed]
+        nD.update_payoffs(self.payoff_tensor, self.distance_matrix, spaces, weights - self.weights[spaces], metrics)
+        self.weights[spaces] = weights
+
+    def mask(self, spaces, metrics=None):
+        """
+        removes the voters on some spaces, setting their weights to zero
+        :param spaces: flat indices of the spaces
+        :param metrics: as in set_weights
+        """
+        self.set_weights(spaces, 0, metrics)
+
+    def equilibria(self, rtol=1e-9):
+        """
+        :param rtol: relative tolerance when comparing payoffs with the best payoff, looser than
+        find_best_responses to allow for the rounding error of updates
+        :return: list of all equilibria, each a tuple of positions, as in nD_equilibria_finder.find_equilibria
+        """
+        return nD.BestResponseIndex(self.payoff_tensor, self.num_positions, self.dimensions, rtol).equilibria()